@@ -0,0 +1,77 @@
+'''
+Benchmark of the substring search (ILIKE '%term%') with and without the pg_trgm index.
+
+It fills a synthetic 'bench_questions' table (1,000,000 rows by default) in a
+Postgres database, times the search terms with a sequential scan, adds the
+'gin_trgm_ops' index (like 'postgres_upgrades' in models.py does for the
+questions table) and times them again. To run it:
+
+    createdb trivia_bench
+    python bench_search.py --database postgresql://postgres@localhost:5432/trivia_bench
+'''
+import argparse
+import statistics
+import time
+from sqlalchemy import create_engine, text
+
+# The search terms: a common whole word, a part of a word ("title" matches "entitled") and a rare term
+TERMS = ['planet', 'itle', 'f00d']
+
+""" This is a helper function to fill the synthetic table inside the database """
+def create_table(connection, rows):
+  connection.execute(text('DROP TABLE IF EXISTS bench_questions'))
+  connection.execute(text('CREATE TABLE bench_questions (id serial PRIMARY KEY, question text)'))
+  # Every question has a random hash and one of a few topic words
+  connection.execute(text(
+    "INSERT INTO bench_questions (question) "
+    "SELECT 'Question ' || md5(i::text) || ' about the ' || "
+    "(ARRAY['planet', 'entitled book', 'river', 'painting', 'title match'])[1 + i % 5] "
+    "FROM generate_series(1, :rows) AS i"), rows=rows)
+  connection.execute(text('ANALYZE bench_questions'))
+
+""" This is a helper function to time the search of a term (in milliseconds) """
+def time_search(connection, term, repeat):
+  timings = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    connection.execute(text('SELECT id, question FROM bench_questions WHERE question ILIKE :pattern'),
+                       pattern='%' + term + '%').fetchall()
+    timings.append((time.perf_counter() - start) * 1000)
+  return statistics.median(timings)
+
+def main():
+  parser = argparse.ArgumentParser(description='Compare ILIKE with and without the pg_trgm index')
+  parser.add_argument('--database', required=True, help='URL of a Postgres database to fill')
+  parser.add_argument('--rows', type=int, default=1000000, help='number of synthetic questions')
+  parser.add_argument('--repeat', type=int, default=5, help='runs of every search (the median is shown)')
+  parser.add_argument('--keep', action='store_true', help="don't drop the table at the end")
+  args = parser.parse_args()
+
+  engine = create_engine(args.database)
+  with engine.connect() as connection:
+    print('Filling bench_questions with {} rows...'.format(args.rows))
+    create_table(connection, args.rows)
+
+    # Time every term without an index (sequential scan)
+    without_index = {term: time_search(connection, term, args.repeat) for term in TERMS}
+
+    print('Creating the trigram index...')
+    start = time.perf_counter()
+    connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    connection.execute(text('CREATE INDEX bench_questions_trgm ON bench_questions USING GIN (question gin_trgm_ops)'))
+    connection.execute(text('ANALYZE bench_questions'))
+    print('Index built in {:.0f} ms'.format((time.perf_counter() - start) * 1000))
+
+    # Time every term again with the index
+    with_index = {term: time_search(connection, term, args.repeat) for term in TERMS}
+
+    print('{:<10} {:>12} {:>12} {:>10}'.format('term', 'ilike (ms)', 'trigram (ms)', 'speedup'))
+    for term in TERMS:
+      print('{:<10} {:>12.1f} {:>12.1f} {:>9.1f}x'.format(
+        term, without_index[term], with_index[term], without_index[term] / with_index[term]))
+
+    if not args.keep:
+      connection.execute(text('DROP TABLE bench_questions'))
+
+if __name__ == '__main__':
+  main()
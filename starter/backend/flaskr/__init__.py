@@ -1,33 +1,68 @@
 import os
+import secrets
 from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
 
-from models import setup_db, Question, Category
-
-QUESTIONS_PER_PAGE = 10
-
-""" This is a helper function to paginate questions """
-def paginate_questions(request, selection):
-  # Take the request's arguments to get the page number
-  page = request.args.get('page', 1, type=int)
-  # Set the start and end based on the 'QUESTIONS_PER_PAGE'
-  start = (page - 1) * QUESTIONS_PER_PAGE
-  end = start + QUESTIONS_PER_PAGE
-
-  # Use the ListInterpolation to format the questions appropriately
-  questions = [question.format() for question in selection]
-  # Set the current page questions from start to end
-  current_questions = questions[start:end]
-
-  # Return a set of questions for the specific request
-  return current_questions
+from models import setup_db, db, Question, versions, normalize_answer, normalize_answers
+from .pagination import paginate_questions
+from .counters import question_counter
+from .categories import category_cache
+from .search import get_search_backend, search_index
+from .cache import LRUCache
+from .quiz import QuizSession, AskedSet, dump_quiz_state, load_quiz_state, adapt_difficulty, next_adaptive_questions
+from .sampling import get_question_selector, database_sampler
+from .attempts import attempt_logger
+from .stats import question_stats
+from .leaderboard import MAX_SCORE, player_leaderboard
+from .bulk import iter_ndjson, iter_json_array, validate_question, import_questions, insert_question, update_question, delete_questions
+from .ingest import question_ingest
+from .idempotency import idempotent
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
+  # Set the default settings (the search backend is 'ilike', the substring search, unless another one is chosen),
+  # then override them by the test config
+  app.config.from_mapping(
+    # The key that signs the quiz state tokens (it must be the same on all the servers)
+    SECRET_KEY=os.environ.get('SECRET_KEY', 'dev'),
+    SEARCH_BACKEND=os.environ.get('SEARCH_BACKEND', 'ilike'),
+    # Number of search results kept in the search cache and how many seconds they're kept
+    SEARCH_CACHE_SIZE=int(os.environ.get('SEARCH_CACHE_SIZE', 1024)),
+    SEARCH_CACHE_TTL=int(os.environ.get('SEARCH_CACHE_TTL', 300)),
+    # The results with more questions than this aren't cached (a search without a page may match the whole table)
+    SEARCH_CACHE_MAX_QUESTIONS=int(os.environ.get('SEARCH_CACHE_MAX_QUESTIONS', 100)),
+    # Number of quiz sessions kept in memory and how many seconds an unused session is kept
+    QUIZ_SESSIONS_MAX=int(os.environ.get('QUIZ_SESSIONS_MAX', 10000)),
+    QUIZ_SESSION_TTL=int(os.environ.get('QUIZ_SESSION_TTL', 1800)),
+    # The most questions a client can ask for in one POST /quizzes (the 'n' parameter)
+    QUIZ_MAX_BATCH=int(os.environ.get('QUIZ_MAX_BATCH', 10)),
+    # The most players GET /leaderboard returns (they're read from memory)
+    LEADERBOARD_MAX_TOP=int(os.environ.get('LEADERBOARD_MAX_TOP', 100)),
+    # The most row errors POST /questions/bulk lists (the others are only counted)
+    BULK_MAX_ERRORS=int(os.environ.get('BULK_MAX_ERRORS', 100)),
+    # Queue the new questions and commit them in groups from a background thread (POST /questions answers 202)
+    ASYNC_INGEST=os.environ.get('ASYNC_INGEST', '').lower() in ('1', 'true', 'yes'),
+    # Number of Idempotency-Key responses kept in memory and how many seconds they're kept
+    IDEMPOTENCY_KEYS_MAX=int(os.environ.get('IDEMPOTENCY_KEYS_MAX', 10000)),
+    IDEMPOTENCY_TTL=int(os.environ.get('IDEMPOTENCY_TTL', 86400)),
+  )
+  if test_config is not None:
+    app.config.update(test_config)
   setup_db(app)
+
+  # Build the in-memory search index at start if it's the selected search backend
+  if app.config['SEARCH_BACKEND'] == 'memory':
+    with app.app_context():
+      search_index.build()
+
+  # The cache of the search results (they're dropped when the questions are written)
+  search_cache = LRUCache(app.config['SEARCH_CACHE_SIZE'], app.config['SEARCH_CACHE_TTL'])
+  # The store of the quiz sessions (the least recently used and the expired sessions are dropped)
+  quiz_sessions = LRUCache(app.config['QUIZ_SESSIONS_MAX'], app.config['QUIZ_SESSION_TTL'])
+  # The responses of the POST requests sent with an Idempotency-Key, so the retries are answered from memory
+  idempotency_store = LRUCache(app.config['IDEMPOTENCY_KEYS_MAX'], app.config['IDEMPOTENCY_TTL'])
   
   '''
   @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -39,9 +74,9 @@ def create_app(test_config=None):
   '''
   @app.after_request
   def after_request(response):
-    response.headers.add('Access-Control-Allow-Headers','Content-Type,Authorization,true')
+    response.headers.add('Access-Control-Allow-Headers','Content-Type,Authorization,If-Match,Idempotency-Key,true')
     response.headers.add('Access-Control-Allow-Methods',
-                         'GET,PUT,POST,DELETE,OPTIONS')
+                         'GET,PUT,PATCH,POST,DELETE,OPTIONS')
     return response
 
   '''
@@ -52,13 +87,10 @@ def create_app(test_config=None):
   """ This endpoint GET all available categories """
   @app.route('/categories') # The default method is GET
   def get_categories():
-    # Retrieve all categories from the database
-    categories = Category.query.all()
-    # Return a jsonify with the categories and set success to true
+    # Return a jsonify with the categories (from the category cache) and set success to true
     return jsonify({
       'success': True,
-      # Use the List Interpolation to format the categories based on their ids and types
-      'categories': {category.id: category.type for category in categories},
+      'categories': category_cache.get(),
     })
 
 
@@ -78,12 +110,12 @@ def create_app(test_config=None):
   """ This endpoint RETRIEVES all questions """
   @app.route('/questions')  # The default method is GET
   def get_questions():
-    # Retrieve all questions from the database ordered by their IDs
-    selection = Question.query.order_by(Question.id).all()
-    # Call the 'paginate_questions' function to get the current page questions
-    current_questions = paginate_questions(request, selection)
-    # Retrieve all categories from the database
-    categories = Category.query.all()
+    # Build the query of all questions ordered by their IDs (it's executed page by page)
+    selection = Question.query.order_by(Question.id)
+    # Add the answer stats of every question if the client asked for them (?stats=true)
+    stats = question_stats if request.args.get('stats') == 'true' else None
+    # Call the 'paginate_questions' function to get the current page questions and the next page cursor
+    current_questions, next_cursor = paginate_questions(request, selection, stats)
 
     # Check if the page number is out of range (page is not found)
     if len(current_questions) == 0:
@@ -94,11 +126,14 @@ def create_app(test_config=None):
     return jsonify({
         'success': True,
         'questions': current_questions,
-        'total_questions': len(Question.query.all()),
-        # Use the ListInterpolation to format the categories based on their ids and types
-        'categories': {category.id: category.type for category in categories},
+        # Take the number of questions from the counter instead of loading all questions
+        'total_questions': question_counter.total(),
+        # Take the categories from the category cache
+        'categories': category_cache.get(),
         # At first the current category is not selected
-        'current_category': None # No specified category
+        'current_category': None, # No specified category
+        # The cursor of the next page (None if this is the last page)
+        'next_cursor': next_cursor
     })
 
 
@@ -114,24 +149,154 @@ def create_app(test_config=None):
   # Set the method to DELETE and the <variable_name> to <question_id>
   @app.route('/questions/<int:question_id>', methods=['DELETE'])
   def delete_question(question_id):
-    # Retrieve the specified question by its ID
-    question = Question.query.get(question_id)
+    # Delete the specified question by its ID with a single DELETE ... RETURNING (it isn't read before)
+    deleted = delete_questions([Question.id == question_id])
 
-    # Check if the question exists or not
-    if question is None:
+    # Check if the question existed or not
+    if not deleted:
       # If the question doesn't exist, send an error (resource isn't found - 404)
       abort(404)
       
-    # If the question exists, delete it
-    question.delete()
-      
     # Return a jsonify with the question's ID and set the success body to true
     return jsonify({
           'success': True,
-          'deleted': question.id
+          'deleted': deleted[0]['id']
       })
 
 
+  """ This endpoint RETRIEVES the status of a question queued in the async ingest mode """
+  @app.route('/questions/tickets/<ticket>')  # The default method is GET
+  def get_ticket(ticket):
+    # Find the ticket (it's kept by the server process that queued the question)
+    status = question_ingest.status(ticket)
+
+    # Check if the ticket exists or not
+    if status is None:
+      # If the ticket doesn't exist or expired, send an error (resource isn't found - 404)
+      abort(404)
+
+    # Return a jsonify with the status and the created question's ID (once it's written) and set success body to true
+    return jsonify(dict(status, success=True, ticket=ticket))
+
+  """ This endpoint UPDATES some fields of a specific question by its ID """
+  # Set the method to PATCH and the <variable_name> to <question_id>
+  @app.route('/questions/<int:question_id>', methods=['PATCH'])
+  def update_question_fields(question_id):
+    # Get the body from the requesst
+    body = request.get_json()
+    # Keep only the fields that can be changed
+    changes = {field: body[field] for field in ('question', 'answer', 'category', 'difficulty', 'aliases') if field in body}
+
+    # Check if there's anything to change
+    if not changes:
+      # Send an error (unprocessable - 422)
+      abort(422)
+
+    # Check the changed fields like POST /questions does (the texts can't be empty and the category must exist)
+    for field in ('question', 'answer'):
+      if field in changes and (not isinstance(changes[field], str) or not changes[field].strip()):
+        abort(422)
+    if 'difficulty' in changes and (not isinstance(changes['difficulty'], int) or isinstance(changes['difficulty'], bool) or
+                                    changes['difficulty'] < 1):
+      abort(422)
+    if 'category' in changes:
+      # The category ID may be sent as a number or as text (like POST /questions and the bulk import take it)
+      try:
+        category = int(changes['category'])
+      except (TypeError, ValueError):
+        abort(422)
+      if category not in category_cache.get():
+        abort(422)
+      # The categories are stored as text
+      changes['category'] = str(category)
+    if 'aliases' in changes and (not isinstance(changes['aliases'], list) or
+                                 not all(isinstance(alias, str) for alias in changes['aliases'])):
+      abort(422)
+
+    # Get the version the client edited, from the If-Match header (the ETag of the question) or the body
+    version = body.get('version')
+    if_match = request.headers.get('If-Match')
+    if if_match and if_match.strip() != '*':
+      try:
+        version = int(if_match.strip().lstrip('W/').strip('"'))
+      except ValueError:
+        # Send an error (bad request - 400)
+        abort(400)
+    if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+      abort(422)
+
+    # Update only the changed columns with a single UPDATE ... RETURNING (only if the question is still at the version)
+    question = update_question(question_id, changes, version)
+
+    if question is None:
+      # Check if the question exists (only read when the update didn't happen)
+      if db.session.query(Question.id).filter(Question.id == question_id).first() is None:
+        # If the question doesn't exist, send an error (resource isn't found - 404)
+        abort(404)
+      # The question was changed since the client read it, send an error (precondition failed - 412)
+      abort(412)
+
+    # Return a jsonify with the updated question and set the success body to true
+    response = jsonify({
+        'success': True,
+        'question': question
+    })
+    # Send the new version as the ETag, so the next edit can send it back in If-Match
+    response.set_etag(str(question['version']))
+    return response
+
+  """ This endpoint DELETES many questions at once by their IDs or by a filter """
+  # Set the method to DELETE
+  @app.route('/questions', methods=['DELETE'])
+  def delete_questions_bulk():
+    # Get the body from the requesst
+    body = request.get_json()
+    # Build the conditions of the questions to delete (all of them must match)
+    conditions = []
+
+    # Check the IDs, the category, the difficulty and the ID range are numbers
+    for name in ('category', 'difficulty', 'min_id', 'max_id'):
+      value = body.get(name)
+      if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+        # Send an error (unprocessable - 422)
+        abort(422)
+    ids = body.get('ids')
+    if ids is not None and (not isinstance(ids, list) or not ids or
+                            not all(isinstance(question_id, int) and not isinstance(question_id, bool) for question_id in ids)):
+      abort(422)
+
+    if ids is not None:
+      conditions.append(Question.id.in_(ids))
+    if body.get('category') is not None:
+      # The categories are stored as text
+      conditions.append(Question.category == str(body['category']))
+    if body.get('difficulty') is not None:
+      conditions.append(Question.difficulty == body['difficulty'])
+    if body.get('min_id') is not None:
+      conditions.append(Question.id >= body['min_id'])
+    if body.get('max_id') is not None:
+      conditions.append(Question.id <= body['max_id'])
+
+    # Check at least one condition is set (an empty body must not delete all the questions)
+    if not conditions:
+      abort(422)
+
+    # Delete the matching questions with a single DELETE ... RETURNING
+    deleted = delete_questions(conditions)
+
+    # Check if any question matched
+    if not deleted:
+      # If no question matched, send an error (resource isn't found - 404)
+      abort(404)
+
+    # Return a jsonify with the deleted questions' IDs and set the success body to true
+    return jsonify({
+        'success': True,
+        'deleted': [row['id'] for row in deleted],
+        'total_deleted': len(deleted)
+    })
+
+
   '''
   @TODO: 
   Create an endpoint to POST a new question, 
@@ -145,6 +310,8 @@ def create_app(test_config=None):
   """ This endpoint CREATES a new question """
   # Set the method to POST
   @app.route('/questions', methods=['POST'])
+  # A retry with the same Idempotency-Key gets the first response again
+  @idempotent(idempotency_store)
   def add_question():
     # Get the body from the requesst
     body = request.get_json()
@@ -154,28 +321,82 @@ def create_app(test_config=None):
     new_answer = body.get('answer')
     new_difficulty = body.get('difficulty')
     new_category = body.get('category')
+    # The other accepted answers are optional
+    new_aliases = body.get('aliases', [])
 
     # Check if the user filled the fields or not
     if (not new_question) or (not new_answer) or (not new_difficulty) or (not new_category):
       # If at least one of the fields is empty, send an error (unprocessable - 422) since they're required
       abort(422)
+
+    # Check the aliases are a list of texts
+    if not isinstance(new_aliases, list) or not all(isinstance(alias, str) for alias in new_aliases):
+      abort(422)
+
+    # In the async ingest mode, queue the question and answer before it's written
+    if app.config['ASYNC_INGEST']:
+      # Check all the fields now, since the client isn't there anymore when the question is written
+      values, error = validate_question(body, category_cache.get())
+      if error is not None:
+        abort(422)
+      ticket = question_ingest.submit(app, values)
+
+      # Check if the queue is full
+      if ticket is None:
+        # Send an error (service unavailable - 503), the client can try again later
+        abort(503)
+
+      # Return a jsonify with the ticket (to get the question's ID from GET /questions/tickets/<ticket>)
+      # and set success body to true
+      return jsonify({
+          'success': True,
+          'ticket': ticket
+      }), 202
     
     try:
-      # Create an instance of the Question model with the form data
-      question = Question(question=new_question,answer=new_answer,category=new_category,difficulty=new_difficulty)
-      # Insert the new quetion to the database
-      question.insert()
+      # Insert the new quetion to the database with a single INSERT ... RETURNING (the ID comes back with it)
+      question = insert_question(new_question, new_answer, new_category, new_difficulty, new_aliases)
 
       # Return a jsonify with the created question's ID and set success body to true
       return jsonify({
           'success': True,
-          'created': question.id,
+          'created': question['id'],
       })
     
     except:
       # If an error occured while proccessing the INSERT, send an error (unprocessable - 422)
       abort(422)
 
+  """ This endpoint CREATES many questions at once from a JSON array or NDJSON (one question per line) """
+  # Set the method to POST
+  @app.route('/questions/bulk', methods=['POST'])
+  # A retry with the same Idempotency-Key gets the first response again
+  @idempotent(idempotency_store)
+  def add_questions_bulk():
+    # Read the body as it arrives, one row at a time (it isn't loaded in memory at once)
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+      rows = iter_ndjson(request.stream)
+    else:
+      rows = iter_json_array(request.stream)
+
+    # Validate the rows (the same fields as POST /questions) and insert them in chunks, one transaction a chunk
+    created, errors = import_questions(rows, category_cache.get())
+
+    # Check if the body had any rows
+    if not created and not errors:
+      # Send an error (unprocessable - 422)
+      abort(422)
+
+    # Return a jsonify with the created questions' IDs and the errors of the other rows and set success body to true
+    return jsonify({
+        'success': True,
+        'created': created,
+        'total_created': len(created),
+        # The rows are numbered from 0 in the order of the body
+        'errors': errors[:app.config['BULK_MAX_ERRORS']],
+        'total_errors': len(errors)
+    })
+
 
 
   '''
@@ -201,19 +422,81 @@ def create_app(test_config=None):
     if not search_term:
       # Send an error (unprocessable - 422)
       abort(422)
+
+    # Normalize the spaces of the search term (the searches ignore the case too)
+    search_term = ' '.join(search_term.split())
+
+    # Check if the same search (and page) was answered since the questions were last written
+    cache_key = (app.config['SEARCH_BACKEND'], search_term.lower(), request.args.get('page'), request.args.get('cursor'))
+    version = versions['questions']
+    cached = search_cache.get(cache_key, version)
+    if cached is not None:
+      return jsonify(cached)
     
-    # Retrieve all questions by using ilike function for the search term
-    # (Reference: https://prodevsblog.com/questions/146983/case-insensitive-flask-sqlalchemy-query/)
-    results = Question.query.filter(Question.question.ilike("%" + search_term + "%")).all()
+    # Get the configured search backend
+    # (ilike by default, or the full-text, trigram or in-memory search when it's chosen and the database supports it)
+    backend = get_search_backend()
+
+    # Check if the client asked for a page or a cursor
+    if 'page' in request.args or 'cursor' in request.args:
+      # Let the backend paginate the matching questions (with the pagination helpers) and get the next page cursor
+      current_questions, next_cursor = backend.paginate(request, search_term)
+      # Count the matching questions separately (without loading them)
+      total_questions = backend.count(search_term)
+    else:
+      # Without a page or a cursor, return all the matching questions
+      # Use the ListInterpolation to format the questions appropriately
+      current_questions = [question.format() for question in backend.query(search_term).all()]
+      total_questions = len(current_questions)
+      next_cursor = None
 
-    # Return a jsonify with the result questions, number of total question, current category
-    # and set success body to true
+    # Set the result questions, number of total question, current category and set success body to true
+    results = {
+        'success': True,
+        'questions': current_questions,
+        'total_questions': total_questions,
+        'current_category': None, # No specified category
+        # The cursor of the next page (None if this is the last page)
+        'next_cursor': next_cursor
+    }
+    # Keep the results in the cache for the data version they were read from (unless they're too large)
+    if len(current_questions) <= app.config['SEARCH_CACHE_MAX_QUESTIONS']:
+      search_cache.set(cache_key, results, version)
+
+    # Return a jsonify with the results
+    return jsonify(results)
+
+  """ This endpoint RETRIEVES the size and the hit/miss/eviction counters of the search cache """
+  @app.route('/questions/search/cache')  # The default method is GET
+  def get_search_cache():
+    # Return a jsonify with the cache stats and set success body to true
+    return jsonify({
+        'success': True,
+        'cache': search_cache.stats()
+    })
+
+  """ This endpoint RETRIEVES the size of the in-memory search index """
+  @app.route('/questions/search/index')  # The default method is GET
+  def get_search_index():
+    # Return a jsonify with the index stats and set success body to true
+    return jsonify({
+        'success': True,
+        'index': search_index.stats()
+    })
+
+  """ This endpoint REBUILDS the in-memory search index from the database """
+  # Set the method to POST
+  @app.route('/questions/search/index', methods=['POST'])
+  def rebuild_search_index():
+    # Read all questions again (to pick up the questions written outside of this server process)
+    search_index.build()
+    # Drop the cached search results too, they may miss the same questions
+    search_cache.clear()
+
+    # Return a jsonify with the new index stats and set success body to true
     return jsonify({
         'success': True,
-        # Use the ListInterpolation to format the questions appropriately
-        'questions': [question.format() for question in results],
-        'total_questions': len(results),
-        'current_category': None # No specified category
+        'index': search_index.stats()
     })
 
   '''
@@ -229,25 +512,38 @@ def create_app(test_config=None):
   # Set the <variable_name> to <category_id> and the default method is GET
   @app.route('/categories/<int:category_id>/questions')
   def get_category_questions(category_id):
-    # Retrieve the category from the database by its ID
-    category = Category.query.get(category_id)
-
-    # Check if the category exists or not (if the user entered an URL with non-existent category ID)
-    if category is None:
+    # Check if the category exists or not in the category cache (if the user entered an URL with non-existent category ID)
+    if category_id not in category_cache.get():
         # If the category doesn't exist, send an error (resource isn't found - 404)
         abort(404)
 
-    # Retrieve all the questions of the specified category from the database
-    questions = Question.query.filter(Question.category == category_id).all()
+    # Build the query of the specified category questions ordered by their IDs
+    selection = Question.query.filter(Question.category == category_id).order_by(Question.id)
+    # Add the answer stats of every question if the client asked for them (?stats=true)
+    stats = question_stats if request.args.get('stats') == 'true' else None
+
+    # Check if the client asked for a page or a cursor
+    if 'page' in request.args or 'cursor' in request.args:
+      # Call the 'paginate_questions' function to get the current page questions and the next page cursor
+      current_questions, next_cursor = paginate_questions(request, selection, stats)
+      # Take the number of the category questions from the counter
+      total_questions = question_counter.category(category_id)
+    else:
+      # Without a page or a cursor, return all the category questions (as the frontend expects)
+      # Use the ListInterpolation to format the questions appropriately
+      current_questions = [question.format(stats) for question in selection.all()]
+      total_questions = len(current_questions)
+      next_cursor = None
 
     # Return a jsonify with the result questions, number of total question, current category
     # and set success body to true
     return jsonify({
       'success': True,
-      # Use the ListInterpolation to format the questions appropriately
-      'questions': [question.format() for question in questions],
-      'total_questions': len(questions),
-      'current_category': category_id  # Set the specified category ID
+      'questions': current_questions,
+      'total_questions': total_questions,
+      'current_category': category_id,  # Set the specified category ID
+      # The cursor of the next page (None if this is the last page)
+      'next_cursor': next_cursor
     })
 
   '''
@@ -279,40 +575,302 @@ def create_app(test_config=None):
       # Send an error (unprocessable - 422)
       abort(422)
 
-    # If the user chooses (ALL)
-    if(category['type'] == 'click'):
-      # Get all questions
-      questions = Question.query.all()
-    else:
-      # Get the specified cateory question
-      questions = Question.query.filter(Question.category == category['id']).all()
-    
-    # Decalre a list for new questions
-    new_questions = []
+    # Get the number of questions to play at once (1 by default)
+    count = body.get('n', 1)
 
-    # Loop all category questions
-    for question in questions:
-      # Check if the question was previously asked or not
-      # (Reference: https://www.geeksforgeeks.org/check-if-element-exists-in-list-in-python/)
-      if question.id not in previous_questions:
-        # Add the new question in the new_questions list
-        new_questions.append(question)
-
-    # Check if there are any more questions or not
-    if len(new_questions) == 0:
-      # If all questions were shown before, set the list to None
-      next_question = None
+    # Check the number of questions is between 1 and 'QUIZ_MAX_BATCH'
+    if not isinstance(count, int) or not 1 <= count <= app.config['QUIZ_MAX_BATCH']:
+      # Send an error (unprocessable - 422)
+      abort(422)
+
+    # Check the previous questions are question IDs
+    try:
+      previous_questions = [int(question_id) for question_id in previous_questions or []]
+    except (TypeError, ValueError):
+      abort(422)
+
+    # Get the asked questions from the quiz state token (sent instead of the previous questions by the new clients)
+    quiz_state = body.get('quiz_state')
+    if quiz_state:
+      # The token is a text, send an error (bad request - 400) for anything else
+      if not isinstance(quiz_state, str):
+        abort(400)
+      asked = load_quiz_state(quiz_state, app.config['SECRET_KEY'])
+      # Check if the token was signed by the server
+      if asked is None:
+        # Send an error (bad request - 400)
+        abort(400)
     else:
-      # If there are questions left, select a random question from the 'new_questions' list and format it
-      # (Reference: https://pynative.com/python-random-choice/)
-      next_question = random.choice(new_questions).format()
+      asked = AskedSet()
+    # Add the previous questions to the asked questions (a bitset, so checking a question is O(1))
+    # The IDs above the largest question ID can't be asked, and they would grow the bitset (and the token) for nothing
+    largest = database_sampler.ids()[1] or 0
+    if previous_questions and max(previous_questions) > largest:
+      # Another server process may have created them since the range was read, so read it again before dropping them
+      largest = database_sampler.ids(reload=True)[1] or 0
+    for question_id in previous_questions:
+      if question_id <= largest:
+        asked.add(question_id)
+
+    # If the user chooses (ALL), choose from all questions, else from the specified category questions
+    category_id = None if category['type'] == 'click' else category['id']
+    # Use the in-memory question pools, or sampling inside the database for the very large tables
+    selector = get_question_selector()
+
+    # Check if the client checks the answers with POST /quizzes/answer (then the answers aren't sent)
+    hide_answer = body.get('hide_answer', False)
+
+    # Check if the client asked for the adaptive mode
+    adaptive = body.get('adaptive', False)
+    if adaptive:
+      # Get the current difficulty (3 by default) and the recent answers (True when correct, the latest last)
+      difficulty = body.get('difficulty', 3)
+      recent_answers = body.get('recent_answers', [])
+
+      # Check the difficulty is a number and the recent answers are a list
+      if not isinstance(difficulty, int) or not isinstance(recent_answers, list):
+        # Send an error (unprocessable - 422)
+        abort(422)
+
+      # Move the difficulty up or down from the recent answers
+      difficulty = adapt_difficulty(difficulty, recent_answers)
+      # Choose the questions at the difficulty (or the closest one) from the (category, difficulty) pools
+      selected = next_adaptive_questions(selector, category_id, asked, count, difficulty)
+    else:
+      # Choose the random questions that weren't asked before in one pass (they're marked as asked)
+      selected = selector.next_questions(category_id, asked, count)
+    questions = [question.format() for question in selected]
+    if hide_answer:
+      for question in questions:
+        del question['answer']
+
+    # Set the next question (None if all questions were shown before), the new quiz state token and set success body to true
+    results = {
+        'success': True,
+        'question': questions[0] if questions else None,
+        'quiz_state': dump_quiz_state(asked, app.config['SECRET_KEY'])
+    }
+    # If the client asked for many questions, add all of them (there may be less if the quiz is almost done)
+    if 'n' in body:
+      results['questions'] = questions
+    # In the adaptive mode, send back the difficulty to send with the next answers
+    if adaptive:
+      results['difficulty'] = difficulty
+
+    # Return a jsonify with the results
+    return jsonify(results)
+
+  """ This endpoint CHECKS the answer of a quiz question """
+  # Set the method to POST
+  @app.route('/quizzes/answer', methods=['POST'])
+  def check_answer():
+    # Get the body from the requesst
+    body = request.get_json()
+    # Get the question ID and the answer the user entered
+    question_id = body.get('question_id')
+    answer = body.get('answer')
+
+    # Check if the question ID or the answer is empty
+    if not isinstance(question_id, int) or not isinstance(answer, str) or not answer.strip():
+      # Send an error (unprocessable - 422)
+      abort(422)
+
+    # Retrieve only the answer and its normalized forms (computed when the question was created)
+    stored = db.session.query(Question.answer, Question.normalized_answer).filter(Question.id == question_id).first()
+
+    # Check if the question exists or not
+    if stored is None:
+      # If the question doesn't exist, send an error (resource isn't found - 404)
+      abort(404)
+
+    # Normalize the answer the same way and compare it to the answer and its aliases
+    # (the questions created before the normalized answers existed are normalized now)
+    normalized_answers = (stored.normalized_answer or normalize_answers(stored.answer)).split('\n')
+    correct = normalize_answer(answer) in normalized_answers
+    # Update the counters and the empirical difficulty of the question in memory
+    # (before the attempt is logged, so the stats don't count it twice if they're loaded now)
+    question_stats.record(question_id, correct)
+    # Log the attempt for the accuracy stats (it's buffered and written in batches in the background)
+    attempt_logger.log(app, question_id, correct)
+
+    # Return a jsonify with the result, the right answer and set success body to true
+    return jsonify({
+        'success': True,
+        'correct': correct,
+        'answer': stored.answer
+    })
+
+  """ This endpoint REPORTS the result of an answer the client checked itself (to keep the question stats) """
+  # Set the method to POST
+  @app.route('/quizzes/report', methods=['POST'])
+  def report_answer():
+    # Get the body from the requesst
+    body = request.get_json()
+    # Get the question ID and whether the user answered correctly
+    question_id = body.get('question_id')
+    correct = body.get('correct')
+
+    # Check if the question ID or the result is missing
+    if not isinstance(question_id, int) or not isinstance(correct, bool):
+      # Send an error (unprocessable - 422)
+      abort(422)
+
+    # Check if the question exists (only its ID is read)
+    if db.session.query(Question.id).filter(Question.id == question_id).first() is None:
+      # If the question doesn't exist, send an error (resource isn't found - 404)
+      abort(404)
+
+    # Update the question stats and log the attempt, the same way as a checked answer
+    question_stats.record(question_id, correct)
+    attempt_logger.log(app, question_id, correct)
+
+    # Return a jsonify with the new stats of the question and set success body to true
+    return jsonify({
+        'success': True,
+        'stats': question_stats.get(question_id)
+    })
+
+  """ This endpoint RETRIEVES the answer stats of a specific question by its ID """
+  @app.route('/questions/<int:question_id>/stats')  # The default method is GET
+  def get_question_stats(question_id):
+    # Retrieve the specified question by its ID
+    question = Question.query.get(question_id)
+
+    # Check if the question exists or not
+    if question is None:
+      # If the question doesn't exist, send an error (resource isn't found - 404)
+      abort(404)
+
+    # Return a jsonify with the question and its stats (None if it was never answered) and set success body to true
+    return jsonify({
+        'success': True,
+        'question': question.format(question_stats),
+        # The counters of the attempt writer
+        'attempts': attempt_logger.stats()
+    })
+
+  """ This endpoint CREATES a server-side quiz session with a specific category or all """
+  # Set the method to POST
+  @app.route('/quizzes/sessions', methods=['POST'])
+  def create_quiz_session():
+    # Get the body from the requesst
+    body = request.get_json()
+    # Get the selected category
+    category = body.get('quiz_category')
+
+    # Check if the quiz_category is empty
+    if not category:
+      # Send an error (unprocessable - 422)
+      abort(422)
+
+    # If the user chooses (ALL), the quiz has all questions, else the specified category questions
+    # (from the in-memory pools, or sampled inside the database for the very large tables)
+    session = QuizSession(None if category['type'] == 'click' else category['id'], get_question_selector())
+    # Store the session by a random ID
+    session_id = secrets.token_urlsafe(16)
+    quiz_sessions.set(session_id, session)
+
+    # Return a jsonify with the session ID, the number of questions and set success body to true
+    return jsonify({
+        'success': True,
+        'session_id': session_id,
+        'total_questions': session.total
+    })
+
+  """ This endpoint PLAYS the next question of a quiz session """
+  # Set the method to POST and the <variable_name> to <session_id>
+  @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+  def play_quiz_session(session_id):
+    # Retrieve the session by its ID
+    session = quiz_sessions.get(session_id)
+
+    # Check if the session exists or not (it may have expired)
+    if session is None:
+      # If the session doesn't exist, send an error (resource isn't found - 404)
+      abort(404)
+
+    # Keep the session for another TTL since it's still played
+    quiz_sessions.set(session_id, session)
+    # Get the next question of the session (None if all questions were shown before)
+    question = session.next_question()
 
     # Return a jsonify with the next question and set success body to true
     return jsonify({
         'success': True,
-        'question': next_question
+        'question': question.format() if question is not None else None
+    })
+
+  """ This endpoint SUBMITS the score of a player to the leaderboard (only the best score of a player is kept) """
+  # Set the method to POST
+  @app.route('/leaderboard', methods=['POST'])
+  def submit_score():
+    # Get the body from the requesst
+    body = request.get_json()
+    # Get the player's name and the score
+    player = body.get('player')
+    score = body.get('score')
+
+    # Check the player is a name and the score is a whole number that isn't negative and fits the score column
+    if (not isinstance(player, str) or not player.strip() or not isinstance(score, int) or isinstance(score, bool)
+        or score < 0 or score > MAX_SCORE):
+      # Send an error (unprocessable - 422)
+      abort(422)
+
+    # Update the in-memory ranking (the changed scores are written to the database every few seconds)
+    best, rank = player_leaderboard.submit(player.strip(), score)
+
+    # Return a jsonify with the best score of the player, its rank and the number of players and set success body to true
+    return jsonify({
+        'success': True,
+        'player': player.strip(),
+        'score': best,
+        'rank': rank,
+        'total_players': player_leaderboard.size()
+    })
+
+  """ This endpoint RETRIEVES the best players of the leaderboard """
+  @app.route('/leaderboard')  # The default method is GET
+  def get_leaderboard():
+    # Take the request's arguments to get the number of players (10 by default)
+    limit = request.args.get('limit', 10, type=int)
+
+    # Check the number of players is between 1 and 'LEADERBOARD_MAX_TOP'
+    if not 1 <= limit <= app.config['LEADERBOARD_MAX_TOP']:
+      # Send an error (unprocessable - 422)
+      abort(422)
+
+    # Return a jsonify with the best players (read from memory, without any query) and set success body to true
+    return jsonify({
+        'success': True,
+        'players': player_leaderboard.top(limit),
+        'total_players': player_leaderboard.size()
     })
 
+  """ This endpoint RETRIEVES the best score and the rank of a specific player """
+  @app.route('/leaderboard/<player>')  # The default method is GET
+  def get_player_rank(player):
+    # Find the player in the in-memory ranking
+    entry = player_leaderboard.rank(player)
+
+    # Check if the player submitted a score or not
+    if entry is None:
+      # If the player doesn't exist, send an error (resource isn't found - 404)
+      abort(404)
+
+    # Return a jsonify with the player's rank and score and set success body to true
+    return jsonify(dict(entry, success=True, total_players=player_leaderboard.size()))
+
+  """ This command FILLS the normalized answers of the questions created before they existed """
+  @app.cli.command('normalize-answers')
+  def normalize_existing_answers():
+    # Retrieve the questions that don't have normalized answers
+    questions = Question.query.filter(Question.normalized_answer.is_(None)).all()
+    for question in questions:
+      question.normalized_answer = normalize_answers(question.answer)
+    # Save all of them at once
+    db.session.commit()
+    print('Normalized {} answers'.format(len(questions)))
+
   '''
   @TODO: 
   Create error handlers for all expected errors 
@@ -346,6 +904,33 @@ def create_app(test_config=None):
         'message': 'Bad Request'
     }), 400
 
+  # Error Handler for (409 - Conflict)
+  @app.errorhandler(409)
+  def conflict(error):
+    return jsonify({
+        'success': False,
+        'error': 409,
+        'message': 'Conflict'
+    }), 409
+
+  # Error Handler for (412 - Precondition Failed)
+  @app.errorhandler(412)
+  def precondition_failed(error):
+    return jsonify({
+        'success': False,
+        'error': 412,
+        'message': 'Precondition Failed'
+    }), 412
+
+  # Error Handler for (503 - Service Unavailable)
+  @app.errorhandler(503)
+  def service_unavailable(error):
+    return jsonify({
+        'success': False,
+        'error': 503,
+        'message': 'Service Unavailable'
+    }), 503
+
   # Error Handler for (500 - Internal Server Error)
   @app.errorhandler(500)
   def internal_server_error(error):
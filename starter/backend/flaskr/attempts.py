@@ -0,0 +1,128 @@
+import atexit
+import io
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+from models import db, Attempt
+
+# Attempts kept in memory at most (the oldest are dropped if the database can't keep up)
+BUFFER_SIZE = 100000
+
+# A batch is written as soon as this many attempts are buffered, or after FLUSH_INTERVAL seconds
+FLUSH_SIZE = 500
+FLUSH_INTERVAL = 1.0
+
+""" This class buffers the quiz attempts in memory and writes them in batches from a background thread """
+class AttemptLogger:
+  def __init__(self):
+    self.lock = threading.Lock()
+    # Held while a batch is written, so the question stats can read the table and the buffer without missing a batch
+    self.writing = threading.Lock()
+    # The ring buffer of the attempts that aren't written yet
+    self.buffer = deque(maxlen=BUFFER_SIZE)
+    # Set to wake the writer up before the interval ends (the buffer is full enough, or the logger stops)
+    self.wake_up = threading.Event()
+    self.thread = None
+    self.app = None
+    self.stopping = False
+    self.written = 0
+    self.dropped = 0
+
+  """ This method buffers an attempt (it doesn't wait for the database) """
+  def log(self, app, question_id, correct):
+    with self.lock:
+      # Start the writer with the first attempt
+      if self.thread is None:
+        self.start(app)
+      if len(self.buffer) == self.buffer.maxlen:
+        self.dropped += 1
+      self.buffer.append((question_id, bool(correct), datetime.utcnow()))
+      if len(self.buffer) >= FLUSH_SIZE:
+        self.wake_up.set()
+
+  """ This method starts the background writer, the lock must be held """
+  def start(self, app):
+    self.app = app
+    self.stopping = False
+    self.thread = threading.Thread(target=self.run, name='attempt-logger', daemon=True)
+    self.thread.start()
+    # Write the buffered attempts before the process exits
+    atexit.register(self.stop)
+
+  """ This method is the loop of the background writer """
+  def run(self):
+    while not self.stopping:
+      self.wake_up.wait(FLUSH_INTERVAL)
+      self.wake_up.clear()
+      self.flush()
+
+  """ This method writes all the buffered attempts, one batch (transaction) at a time """
+  def flush(self):
+    while True:
+      with self.writing:
+        with self.lock:
+          rows = [self.buffer.popleft() for _ in range(min(FLUSH_SIZE, len(self.buffer)))]
+        if not rows:
+          return
+
+        try:
+          with self.app.app_context():
+            self.write(rows)
+          self.written += len(rows)
+        except Exception:
+          logging.getLogger(__name__).exception('Could not write %d attempts', len(rows))
+          # Put the batch back in front of the buffer to try again on the next flush
+          with self.lock:
+            self.buffer.extendleft(reversed(rows))
+          return
+
+  """ This method inserts a batch of attempts with a single statement """
+  def write(self, rows):
+    if db.engine.dialect.name == 'postgresql':
+      # Stream the batch with COPY (the fastest way to load rows into Postgres)
+      data = io.StringIO(''.join('{}\t{}\t{}\n'.format(question_id, 't' if correct else 'f', created_at.isoformat())
+                                 for question_id, correct, created_at in rows))
+      connection = db.engine.raw_connection()
+      try:
+        with connection.cursor() as cursor:
+          cursor.copy_from(data, Attempt.__tablename__, columns=('question_id', 'correct', 'created_at'))
+        connection.commit()
+      finally:
+        connection.close()
+    else:
+      # Insert the batch with executemany
+      db.engine.execute(Attempt.__table__.insert(), [
+        {'question_id': question_id, 'correct': correct, 'created_at': created_at}
+        for question_id, correct, created_at in rows
+      ])
+
+  """ This method stops the background writer and writes the attempts that are still buffered """
+  def stop(self):
+    thread = self.thread
+    if thread is None:
+      return
+    self.stopping = True
+    self.wake_up.set()
+    thread.join()
+    self.thread = None
+    # Write what was buffered after the last flush of the writer
+    self.flush()
+
+  """ This method returns a copy of the buffered (question_id, correct, created_at) attempts that aren't written yet """
+  def pending(self):
+    with self.lock:
+      return list(self.buffer)
+
+  """ This method returns the counters of the logger """
+  def stats(self):
+    with self.lock:
+      return {
+        'buffered': len(self.buffer),
+        'written': self.written,
+        'dropped': self.dropped
+      }
+
+# The logger shared by all the requests
+attempt_logger = AttemptLogger()
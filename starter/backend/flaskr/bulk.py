@@ -0,0 +1,300 @@
+import codecs
+import io
+import json
+import logging
+from flask import abort
+
+from sqlalchemy import case, func, literal
+
+from models import db, Question, normalize_answers, notify
+
+# Questions inserted in one transaction (and one COPY on Postgres)
+CHUNK_SIZE = 1000
+
+# Bytes read from the request at a time when parsing a JSON array
+READ_SIZE = 65536
+
+# The longest element of a JSON array in characters (a longer one is reported as malformed)
+MAX_ELEMENT_SIZE = 1048576
+
+# The error of the row where the reading of a JSON array stopped (the rows after it aren't read)
+STOPPED_ERROR = 'not valid JSON, this row and the rows after it were not imported'
+
+""" This is a helper function to read the rows of an NDJSON body one line at a time, yielding (row, error) """
+def iter_ndjson(stream):
+  for line in stream:
+    line = line.strip()
+    # Skip the empty lines
+    if not line:
+      continue
+    try:
+      yield json.loads(line), None
+    except ValueError:
+      yield None, 'not valid JSON'
+
+""" This is a helper function to read the rows of a JSON array body one element at a time, yielding (row, error)
+(a malformed element stops the reading with an error, since the next elements can't be found after it) """
+def iter_json_array(stream):
+  decoder = json.JSONDecoder()
+  # Decode the UTF-8 across the reads, so a character split between two reads stays whole
+  utf8 = codecs.getincrementaldecoder('utf-8')()
+  buffer = ''
+  position = 0
+  started = False
+  done = False
+  # Set when the body has bytes that aren't UTF-8 (it's read up to them)
+  broken = False
+
+  while True:
+    # Skip the whitespace and the separators before the next element
+    while position < len(buffer) and (buffer[position].isspace() or (started and buffer[position] == ',')):
+      position += 1
+
+    if position < len(buffer):
+      if not started:
+        # If the body isn't an array, send an error (bad request - 400)
+        if buffer[position] != '[':
+          abort(400)
+        started = True
+        position += 1
+        continue
+      if buffer[position] == ']':
+        return
+      try:
+        # Decode the next element if it's complete in the buffer
+        row, end = decoder.raw_decode(buffer, position)
+        decoded = True
+      except ValueError:
+        decoded = False
+      # A number at the end of the buffer may go on in the next read
+      if decoded and (end < len(buffer) or (done and not broken)):
+        yield row, None
+        position = end
+        continue
+
+      # An element that is still incomplete after the end of the body or 'MAX_ELEMENT_SIZE' characters is malformed
+      if done or len(buffer) - position > MAX_ELEMENT_SIZE:
+        yield None, STOPPED_ERROR
+        return
+
+    if done:
+      # The elements before the bytes that aren't UTF-8 were read, the next ones can't be
+      if broken:
+        yield None, STOPPED_ERROR
+      return
+
+    # Read more of the body (an element may be split between two reads) and drop the decoded part
+    data = stream.read(READ_SIZE)
+    try:
+      text = utf8.decode(data, final=not data)
+    except UnicodeDecodeError as error:
+      # Keep the text before the bytes that aren't UTF-8 and stop reading there (they aren't replaced)
+      text = error.object[:error.start].decode('utf-8')
+      broken = True
+    buffer = buffer[position:] + text
+    position = 0
+    if not data or broken:
+      done = True
+
+""" This is a helper function to check a row and build the values of its question (an error message if it isn't valid) """
+def validate_question(row, categories):
+  if not isinstance(row, dict):
+    return None, 'the row must be an object'
+
+  question = row.get('question')
+  answer = row.get('answer')
+  category = row.get('category')
+  difficulty = row.get('difficulty')
+  aliases = row.get('aliases', [])
+
+  # The same fields as POST /questions are required
+  if not isinstance(question, str) or not question.strip() or not isinstance(answer, str) or not answer.strip():
+    return None, 'the question and the answer are required'
+  if not isinstance(difficulty, int) or isinstance(difficulty, bool) or difficulty < 1:
+    return None, 'the difficulty must be a positive number'
+  try:
+    category = int(category)
+  except (TypeError, ValueError):
+    return None, 'the category must be a category ID'
+  if category not in categories:
+    return None, 'the category does not exist'
+  if not isinstance(aliases, list) or not all(isinstance(alias, str) for alias in aliases):
+    return None, 'the aliases must be a list of texts'
+
+  return {
+    'question': question,
+    'answer': answer,
+    # The categories are stored as text (like POST /questions stores them)
+    'category': str(category),
+    'difficulty': difficulty,
+    'normalized_answer': normalize_answers(answer, aliases)
+  }, None
+
+""" This is a helper function to escape a value for the text format of COPY """
+def copy_value(value):
+  return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+""" This is a helper function to insert a chunk of questions in one transaction, it sets their IDs """
+def insert_questions(rows):
+  columns = ('id', 'question', 'answer', 'category', 'difficulty', 'normalized_answer')
+
+  if db.engine.dialect.name == 'postgresql':
+    connection = db.engine.raw_connection()
+    try:
+      with connection.cursor() as cursor:
+        # Take the IDs of the chunk from the sequence first, since COPY can't return them
+        cursor.execute("SELECT nextval(pg_get_serial_sequence('questions', 'id')) FROM generate_series(1, %s)", (len(rows),))
+        for row, (question_id,) in zip(rows, cursor.fetchall()):
+          row['id'] = question_id
+        # Stream the chunk with COPY (the fastest way to load rows into Postgres)
+        data = io.StringIO(''.join('\t'.join(copy_value(row[column]) for column in columns) + '\n' for row in rows))
+        cursor.copy_from(data, Question.__tablename__, columns=columns)
+      connection.commit()
+    except Exception:
+      connection.rollback()
+      raise
+    finally:
+      connection.close()
+  else:
+    # Insert the rows one by one in a single transaction to get their IDs
+    with db.engine.begin() as connection:
+      for row in rows:
+        row['id'] = connection.execute(Question.__table__.insert(), row).inserted_primary_key[0]
+
+  # Update the in-process caches, the counters and the search index with the whole chunk at once
+  notify('questions', 'insert', [{column: row[column] for column in ('id', 'question', 'answer', 'category', 'difficulty')}
+                                 for row in rows])
+
+""" This is a helper function to insert one question with a single statement, it returns its row """
+def insert_question(question, answer, category, difficulty, aliases=()):
+  table = Question.__table__
+  values = {
+    'question': question,
+    'answer': answer,
+    'category': category,
+    'difficulty': difficulty,
+    # Normalize the answer once, when the question is created (like the Question model)
+    'normalized_answer': normalize_answers(answer, aliases)
+  }
+  statement = table.insert().values(values)
+
+  with db.engine.begin() as connection:
+    if db.engine.dialect.name == 'postgresql':
+      # INSERT ... RETURNING gives back the stored row in the same round trip
+      row = dict(connection.execute(statement.returning(*table.c)).first())
+    else:
+      row = dict(values, id=connection.execute(statement).inserted_primary_key[0])
+
+  row = {column: row[column] for column in ('id', 'question', 'answer', 'category', 'difficulty')}
+  # Update the in-process caches, the counters and the search index
+  notify('questions', 'insert', [row])
+  return row
+
+""" This is a helper function to update the changed columns of a question with a single statement (only if it's still
+at 'version' when a version is given), it returns its new row, or None if it's missing or at another version """
+def update_question(question_id, changes, version=None):
+  table = Question.__table__
+  values = dict((column, changes[column]) for column in ('question', 'answer', 'category', 'difficulty') if column in changes)
+
+  # Keep the normalized answer current: its first line is the answer and the next lines are the aliases
+  if 'aliases' in changes:
+    aliases = normalize_answers('', changes['aliases'])
+  if 'answer' in changes and 'aliases' in changes:
+    values['normalized_answer'] = normalize_answers(changes['answer'], changes['aliases'])
+  elif 'answer' in changes or 'aliases' in changes:
+    # Split the stored value at its first line break inside the statement, so the question isn't read before
+    stored = table.c.normalized_answer
+    newline = (func.strpos if db.engine.dialect.name == 'postgresql' else func.instr)(stored, '\n')
+    if 'answer' in changes:
+      # The new answer followed by the stored aliases
+      tail = case([(newline > 0, func.substr(stored, newline))], else_='')
+      values['normalized_answer'] = literal(normalize_answers(changes['answer'])) + tail
+    else:
+      # The stored answer followed by the new aliases
+      head = case([(newline > 0, func.substr(stored, 1, newline - 1))], else_=stored)
+      values['normalized_answer'] = head + literal('\n' + aliases if aliases else '')
+
+  # Every update moves the question to the next version
+  values['version'] = table.c.version + 1
+  condition = table.c.id == question_id
+  if version is not None:
+    condition = db.and_(condition, table.c.version == version)
+  statement = table.update().where(condition).values(values)
+
+  with db.engine.begin() as connection:
+    if db.engine.dialect.name == 'postgresql':
+      # UPDATE ... RETURNING gives back the new row in the same round trip
+      row = connection.execute(statement.returning(*table.c)).first()
+    elif connection.execute(statement).rowcount:
+      # Read the new row in the same transaction (RETURNING isn't supported)
+      row = connection.execute(db.select(table.c).where(table.c.id == question_id)).first()
+    else:
+      row = None
+
+    # A question created before the normalized answers existed has none to keep the answer from (the database can't
+    # normalize it), so normalize its answer here with the new aliases, in the same transaction
+    if row is not None and 'aliases' in changes and row['normalized_answer'] is None:
+      connection.execute(table.update().where(table.c.id == question_id)
+                         .values(normalized_answer=normalize_answers(row['answer'], changes['aliases'])))
+
+  if row is None:
+    return None
+  row = {column: row[column] for column in ('id', 'question', 'answer', 'category', 'difficulty', 'version')}
+  # Update the in-process caches, the counters and the search index (the listeners skip what didn't change)
+  notify('questions', 'update', [dict(row, changed=sorted(values))])
+  return row
+
+""" This is a helper function to import the rows of a body chunk by chunk, it returns the created IDs and the row errors """
+def import_questions(rows, categories):
+  created = []
+  errors = []
+  chunk = []
+  indexes = []
+
+  def flush():
+    try:
+      insert_questions(chunk)
+      created.extend(row['id'] for row in chunk)
+    except Exception:
+      logging.getLogger(__name__).exception('Could not insert %d questions', len(chunk))
+      # Only this chunk is lost, the chunks before it are committed
+      errors.extend({'index': index, 'error': 'the chunk of this row could not be inserted'} for index in indexes)
+    chunk.clear()
+    indexes.clear()
+
+  for index, (row, error) in enumerate(rows):
+    if error is None:
+      values, error = validate_question(row, categories)
+    if error is not None:
+      # Report the row and go on with the next ones
+      errors.append({'index': index, 'error': error})
+      continue
+    chunk.append(values)
+    indexes.append(index)
+    if len(chunk) >= CHUNK_SIZE:
+      flush()
+
+  if chunk:
+    flush()
+  return created, errors
+
+""" This is a helper function to delete the questions matching all the conditions with one statement, it returns their rows """
+def delete_questions(conditions):
+  table = Question.__table__
+  statement = table.delete().where(db.and_(*conditions))
+
+  if db.engine.dialect.name == 'postgresql':
+    # DELETE ... RETURNING gives back the deleted rows in the same round trip
+    with db.engine.begin() as connection:
+      rows = connection.execute(statement.returning(*table.c)).fetchall()
+  else:
+    # Read the rows and delete them in one transaction (RETURNING isn't supported)
+    with db.engine.begin() as connection:
+      rows = connection.execute(db.select(table.c).where(db.and_(*conditions))).fetchall()
+      connection.execute(statement)
+
+  rows = [{column: row[column] for column in ('id', 'question', 'answer', 'category', 'difficulty')} for row in rows]
+  # Update the in-process caches, the counters and the search index with all the deleted rows at once
+  if rows:
+    notify('questions', 'delete', rows)
+  return rows
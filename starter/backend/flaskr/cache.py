@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+
+""" This class is a bounded in-memory cache that drops the least recently used entries and the expired ones """
+class LRUCache:
+  def __init__(self, max_size, ttl):
+    self.lock = threading.Lock()
+    self.max_size = max_size
+    # Seconds an entry stays valid
+    self.ttl = ttl
+    # The entries by key: (data version, expiry time, value), the least recently used first
+    self.entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.expirations = 0
+
+  """ This method returns the value of a key, or None if it's missing, expired or stored for another data version """
+  def get(self, key, version=None):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        self.misses += 1
+        return None
+
+      entry_version, expires_at, value = entry
+      if entry_version != version or time.monotonic() > expires_at:
+        # The data was written since the entry was stored, or the entry is too old
+        del self.entries[key]
+        self.expirations += 1
+        self.misses += 1
+        return None
+
+      # Mark the entry as the most recently used
+      self.entries.move_to_end(key)
+      self.hits += 1
+      return value
+
+  """ This method stores the value of a key for a data version, dropping the least recently used entries if it's full """
+  def set(self, key, value, version=None):
+    with self.lock:
+      self.entries[key] = (version, time.monotonic() + self.ttl, value)
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.max_size:
+        self.entries.popitem(last=False)
+        self.evictions += 1
+
+  """ This method stores the value of a key only if the key is missing or expired, it returns True if it was stored """
+  def add(self, key, value, version=None):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is not None and entry[0] == version and time.monotonic() <= entry[1]:
+        return False
+      self.entries[key] = (version, time.monotonic() + self.ttl, value)
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.max_size:
+        self.entries.popitem(last=False)
+        self.evictions += 1
+      return True
+
+  """ This method drops the entry of a key (if it's there) """
+  def delete(self, key):
+    with self.lock:
+      self.entries.pop(key, None)
+
+  """ This method drops all the entries """
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+
+  """ This method returns the size and the counters of the cache """
+  def stats(self):
+    with self.lock:
+      return {
+        'size': len(self.entries),
+        'max_size': self.max_size,
+        'ttl': self.ttl,
+        'hits': self.hits,
+        'misses': self.misses,
+        'evictions': self.evictions,
+        'expirations': self.expirations
+      }
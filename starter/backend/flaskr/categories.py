@@ -0,0 +1,47 @@
+import threading
+import time
+
+from models import Category, listen
+
+# Seconds before the categories are loaded again from the database
+# (so the categories written by the other server processes are picked up too)
+CATEGORIES_MAX_AGE = 300
+
+""" This class keeps the {id: type} map of the categories in memory """
+class CategoryCache:
+  def __init__(self):
+    self.lock = threading.Lock()
+    # The map of the categories (None until it's loaded)
+    self.categories = None
+    self.loaded_at = 0
+    # The version is increased by every invalidation, so a load that raced with a write isn't kept
+    self.version = 0
+
+  """ This method returns the {id: type} map of the categories (it must not be changed by the caller) """
+  def get(self):
+    with self.lock:
+      categories = self.categories
+      version = self.version
+      if categories is not None and time.monotonic() - self.loaded_at <= CATEGORIES_MAX_AGE:
+        return categories
+
+    # Retrieve all categories from the database (outside of the lock, so invalidations aren't blocked)
+    # Use the List Interpolation to format the categories based on their ids and types
+    categories = {category.id: category.type for category in Category.query.all()}
+
+    with self.lock:
+      # Keep the map only if no category was written while it was loading
+      if version == self.version:
+        self.categories = categories
+        self.loaded_at = time.monotonic()
+    return categories
+
+  """ This method drops the map so it's loaded again on the next read """
+  def invalidate(self, *args):
+    with self.lock:
+      self.categories = None
+      self.version += 1
+
+# The cache shared by all the endpoints, invalidated by the category writes
+category_cache = CategoryCache()
+listen('categories', category_cache.invalidate)
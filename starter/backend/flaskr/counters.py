@@ -0,0 +1,86 @@
+import threading
+import time
+from sqlalchemy import func
+
+from models import db, Question, listen, category_key
+
+# Seconds before the counts are loaded again from the database
+# (so the questions written by the other server processes are counted too)
+COUNTS_MAX_AGE = 60
+
+""" This class keeps the number of questions of each category in memory """
+class QuestionCounter:
+  def __init__(self):
+    self.lock = threading.Lock()
+    # The counts by category key (None until they're loaded)
+    self.per_category = None
+    self.loaded_at = 0
+    # The version is increased by every write, so a load that raced with a write isn't kept
+    self.version = 0
+
+  """ This method counts the questions of every category with a single GROUP BY query """
+  def load(self):
+    rows = db.session.query(Question.category, func.count(Question.id)).group_by(Question.category).all()
+    per_category = {}
+    for category, count in rows:
+      key = category_key(category)
+      per_category[key] = per_category.get(key, 0) + count
+    return per_category
+
+  """ This method returns a copy of the counts by category (the writes change them while the copy is read),
+  loading them if they're missing or too old """
+  def counts(self):
+    with self.lock:
+      if self.per_category is not None and time.monotonic() - self.loaded_at <= COUNTS_MAX_AGE:
+        return dict(self.per_category)
+      version = self.version
+
+    # Count the questions outside of the lock, so the writes aren't blocked
+    per_category = self.load()
+
+    with self.lock:
+      # Keep the counts only if no question was written while they were counted
+      # (a question committed before the count but applied after it would be counted twice)
+      if version == self.version:
+        self.per_category = per_category
+        self.loaded_at = time.monotonic()
+    return dict(per_category)
+
+  """ This method returns the number of all questions """
+  def total(self):
+    return sum(self.counts().values())
+
+  """ This method returns the number of questions of a specific category """
+  def category(self, category_id):
+    return self.counts().get(category_key(category_id), 0)
+
+  """ This method updates the counts after questions are written """
+  def apply(self, action, rows):
+    with self.lock:
+      self.version += 1
+      # Nothing to update if the counts aren't loaded yet
+      if self.per_category is None:
+        return
+
+      if action == 'update':
+        # The category of a question may have changed, so count them again on the next read
+        # (unless the rows list the changed columns and none of them is the category)
+        if any('category' in row.get('changed', ['category']) for row in rows):
+          self.per_category = None
+        return
+
+      # Add 1 for every inserted question and subtract 1 for every deleted question
+      step = 1 if action == 'insert' else -1
+      for row in rows:
+        key = category_key(row['category'])
+        self.per_category[key] = self.per_category.get(key, 0) + step
+
+  """ This method drops the counts so they're loaded again on the next read """
+  def invalidate(self):
+    with self.lock:
+      self.per_category = None
+      self.version += 1
+
+# The counter shared by all the endpoints, kept current by the question writes
+question_counter = QuestionCounter()
+listen('questions', question_counter.apply)
@@ -0,0 +1,91 @@
+import functools
+import hashlib
+from flask import abort, current_app, make_response, request
+
+# The value stored for a key while its first request is running
+PENDING = 'pending'
+
+# The longest Idempotency-Key accepted
+MAX_KEY_LENGTH = 255
+
+# Bytes read at a time when the rest of a body is hashed
+READ_SIZE = 65536
+
+""" This class wraps the request stream to hash the body while the endpoint reads it (so a large body isn't kept in memory) """
+class BodyHash:
+  def __init__(self, stream):
+    self.stream = stream
+    self.sha256 = hashlib.sha256()
+
+  def read(self, size=-1):
+    data = self.stream.read(size)
+    self.sha256.update(data)
+    return data
+
+  def readline(self, size=-1):
+    line = self.stream.readline(size)
+    self.sha256.update(line)
+    return line
+
+  def __iter__(self):
+    return iter(self.readline, b'')
+
+  """ This method hashes the rest of the body (the endpoint may not read all of it) and returns the digest """
+  def hexdigest(self):
+    while self.read(READ_SIZE):
+      pass
+    return self.sha256.hexdigest()
+
+""" This is a decorator for the POST endpoints: a request with an Idempotency-Key header that was already answered
+gets the stored response again from 'store' (an LRUCache), without running the endpoint or touching the database
+(the key must come with the same body, since the response is stored with a hash of it) """
+def idempotent(store):
+  def decorator(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+      key = request.headers.get('Idempotency-Key')
+      # Without a key, every request runs
+      if key is None:
+        return view(*args, **kwargs)
+
+      # Check the key isn't empty or too long, send an error (bad request - 400)
+      if not key.strip() or len(key) > MAX_KEY_LENGTH:
+        abort(400)
+
+      # The same key may be used on different endpoints
+      store_key = (request.path, key)
+      # Mark the key as running, unless a request with it already ran or is running
+      if not store.add(store_key, PENDING):
+        stored = store.get(store_key)
+        if stored == PENDING:
+          # The first request isn't answered yet, send an error (conflict - 409), the client can try again later
+          abort(409)
+        if stored is not None:
+          body, status, digest = stored
+          # The key was used for another body, send an error (unprocessable - 422)
+          if BodyHash(request.stream).hexdigest() != digest:
+            abort(422)
+          # Send the stored response again
+          response = current_app.response_class(body, status=status, mimetype='application/json')
+          response.headers['Idempotent-Replayed'] = 'true'
+          return response
+        # The stored response expired between the two calls, so run the request
+        store.set(store_key, PENDING)
+
+      # Hash the body while the endpoint reads it
+      request.stream = hashed = BodyHash(request.stream)
+      try:
+        response = make_response(view(*args, **kwargs))
+      except Exception:
+        # The request failed (like a 422 for bad input), so a retry with the same key runs again
+        store.delete(store_key)
+        raise
+
+      # Keep the successful responses, the others can be retried
+      if response.status_code < 400:
+        store.set(store_key, (response.get_data(), response.status_code, hashed.hexdigest()))
+      else:
+        store.delete(store_key)
+      return response
+    return wrapper
+  return decorator
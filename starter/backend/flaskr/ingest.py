@@ -0,0 +1,124 @@
+import atexit
+import logging
+import secrets
+import threading
+from collections import deque
+
+from .bulk import insert_questions
+from .cache import LRUCache
+
+# Questions waiting to be written at most (the submissions are refused while the queue is full)
+QUEUE_SIZE = 10000
+
+# Questions committed together in one transaction
+GROUP_SIZE = 500
+
+# Seconds the writer waits for submissions before checking if it should stop
+WAIT_INTERVAL = 1.0
+
+# Tickets kept to answer the status requests, and how many seconds a ticket is kept
+TICKETS_MAX = 100000
+TICKET_TTL = 3600
+
+""" This class queues the submitted questions and commits them in groups from a background thread """
+class QuestionIngest:
+  def __init__(self):
+    self.lock = threading.Lock()
+    # The (ticket, values) of the questions that aren't written yet
+    self.queue = deque()
+    # The status of every ticket: 'queued', then 'created' with the question's ID, or 'failed'
+    self.tickets = LRUCache(TICKETS_MAX, TICKET_TTL)
+    # Set when a question is queued (or the writer stops)
+    self.wake_up = threading.Event()
+    self.thread = None
+    self.app = None
+    self.stopping = False
+    self.written = 0
+    self.failed = 0
+
+  """ This method queues a validated question and returns its ticket (None if the queue is full) """
+  def submit(self, app, values):
+    with self.lock:
+      # Start the writer with the first question
+      if self.thread is None:
+        self.start(app)
+      if len(self.queue) >= QUEUE_SIZE:
+        return None
+      ticket = secrets.token_urlsafe(16)
+      self.tickets.set(ticket, {'status': 'queued'})
+      self.queue.append((ticket, values))
+    self.wake_up.set()
+    return ticket
+
+  """ This method returns the status of a ticket (None if it's unknown or expired) """
+  def status(self, ticket):
+    return self.tickets.get(ticket)
+
+  """ This method starts the background writer, the lock must be held """
+  def start(self, app):
+    self.app = app
+    self.stopping = False
+    self.thread = threading.Thread(target=self.run, name='question-ingest', daemon=True)
+    self.thread.start()
+    # Write the queued questions before the process exits
+    atexit.register(self.stop)
+
+  """ This method is the loop of the background writer """
+  def run(self):
+    while not self.stopping:
+      self.wake_up.wait(WAIT_INTERVAL)
+      self.wake_up.clear()
+      self.flush()
+
+  """ This method writes all the queued questions, one group (transaction) at a time """
+  def flush(self):
+    while True:
+      # The questions that arrived while the last group was written are committed together
+      with self.lock:
+        group = [self.queue.popleft() for _ in range(min(GROUP_SIZE, len(self.queue)))]
+      if not group:
+        return
+
+      with self.app.app_context():
+        try:
+          insert_questions([values for _, values in group])
+          written = group
+        except Exception:
+          logging.getLogger(__name__).exception('Could not write a group of %d questions', len(group))
+          # Write them one by one, so a question that can't be written doesn't fail the others
+          written = []
+          for ticket, values in group:
+            try:
+              insert_questions([values])
+              written.append((ticket, values))
+            except Exception:
+              self.tickets.set(ticket, {'status': 'failed'})
+              self.failed += 1
+
+      for ticket, values in written:
+        self.tickets.set(ticket, {'status': 'created', 'created': values['id']})
+      self.written += len(written)
+
+  """ This method stops the background writer and writes the questions that are still queued """
+  def stop(self):
+    thread = self.thread
+    if thread is None:
+      return
+    self.stopping = True
+    self.wake_up.set()
+    thread.join()
+    self.thread = None
+    # Write what was queued after the last flush of the writer
+    self.flush()
+
+  """ This method returns the counters of the writer """
+  def stats(self):
+    with self.lock:
+      return {
+        'queued': len(self.queue),
+        'written': self.written,
+        'failed': self.failed
+      }
+
+# The writer shared by all the requests
+question_ingest = QuestionIngest()
@@ -0,0 +1,311 @@
+import atexit
+import logging
+import random
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, LeaderboardEntry
+
+# Seconds between two snapshots of the changed scores to the database
+SNAPSHOT_INTERVAL = 5.0
+
+# Seconds between two reads of the scores written by the other server processes
+REFRESH_INTERVAL = 60.0
+
+# The entries written this many seconds before the last refresh are read again (the server clocks may differ a little)
+REFRESH_SLACK = 10
+
+# The best score a player can submit (the largest value of the Integer column)
+MAX_SCORE = 2147483647
+
+# The snapshots a score that can't be written is tried in before it's dropped (it stays ranked in memory)
+WRITE_ATTEMPTS = 5
+
+# The skip list levels (enough for 2^32 players) and the chance a node goes up one more level
+MAX_LEVELS = 32
+LEVEL_CHANCE = 0.5
+
+""" This class is a node of the skip list: its key, and the next node and the distance to it on every level """
+class Node:
+  __slots__ = ('key', 'next', 'width')
+
+  def __init__(self, key, levels):
+    self.key = key
+    self.next = [None] * levels
+    self.width = [1] * levels
+
+""" This class is an indexable skip list: a sorted list of keys where inserts, removes and ranks are O(log n)
+(Reference: https://code.activestate.com/recipes/576930/) """
+class RankedList:
+  def __init__(self):
+    # The tail stands after all the keys, so the searches stop at it
+    self.tail = Node(None, 0)
+    self.head = Node(None, MAX_LEVELS)
+    self.head.next = [self.tail] * MAX_LEVELS
+    self.size = 0
+
+  def __len__(self):
+    return self.size
+
+  """ This is a helper method to find the last node before a key on every level, and how far it is from the head """
+  def path(self, key):
+    chain = [None] * MAX_LEVELS
+    positions = [0] * MAX_LEVELS
+    node = self.head
+    position = 0
+    for level in reversed(range(MAX_LEVELS)):
+      while node.next[level] is not self.tail and node.next[level].key < key:
+        position += node.width[level]
+        node = node.next[level]
+      chain[level] = node
+      positions[level] = position
+    return chain, positions
+
+  """ This method inserts a key """
+  def insert(self, key):
+    chain, positions = self.path(key)
+    # The new key goes right after the node found on the lowest level
+    position = positions[0] + 1
+
+    # Every level up is reached by half of the nodes of the level below
+    levels = 1
+    while levels < MAX_LEVELS and random.random() < LEVEL_CHANCE:
+      levels += 1
+
+    node = Node(key, levels)
+    for level in range(MAX_LEVELS):
+      previous = chain[level]
+      if level < levels:
+        # Link the new node after the previous one and split the distance between them
+        node.next[level] = previous.next[level]
+        previous.next[level] = node
+        node.width[level] = previous.width[level] - (position - positions[level]) + 1
+        previous.width[level] = position - positions[level]
+      else:
+        # The link passes over the new node, so it's one step longer
+        previous.width[level] += 1
+    self.size += 1
+
+  """ This method removes a key (it must be in the list) """
+  def remove(self, key):
+    chain, _ = self.path(key)
+    node = chain[0].next[0]
+    if node is self.tail or node.key != key:
+      raise KeyError(key)
+
+    for level in range(MAX_LEVELS):
+      previous = chain[level]
+      if level < len(node.next):
+        # Unlink the node and join the distances before and after it
+        previous.width[level] += node.width[level] - 1
+        previous.next[level] = node.next[level]
+      else:
+        # The link passed over the node, so it's one step shorter
+        previous.width[level] -= 1
+    self.size -= 1
+
+  """ This method returns the position of a key in the list (1 for the first key) """
+  def rank(self, key):
+    _, positions = self.path(key)
+    return positions[0] + 1
+
+  """ This method returns the first 'count' keys """
+  def first(self, count):
+    keys = []
+    node = self.head.next[0]
+    while node is not self.tail and len(keys) < count:
+      keys.append(node.key)
+      node = node.next[0]
+    return keys
+
+""" This class keeps the best score of every player ranked in memory, and snapshots the changed scores to the database """
+class Leaderboard:
+  def __init__(self):
+    self.lock = threading.Lock()
+    # The players ranked by (-score, player), so the best score comes first and the ties are sorted by name
+    self.ranking = RankedList()
+    # The best score by player (None until they're loaded)
+    self.scores = None
+    # The players whose score changed since the last snapshot
+    self.dirty = set()
+    # The snapshots that failed to write a player's score, by player
+    self.failures = {}
+    self.refreshed_at = None
+    self.wake_up = threading.Event()
+    self.thread = None
+    self.app = None
+    self.stopping = False
+
+  """ This method loads the scores from the database and starts the background writer, the lock must be held """
+  def load(self):
+    if self.scores is None:
+      self.scores = {}
+      self.ranking = RankedList()
+      self.refreshed_at = datetime.utcnow()
+      for player, score in db.session.query(LeaderboardEntry.player, LeaderboardEntry.score):
+        self.set_score(player, score)
+    # Start the writer with the first request (or again after it was stopped)
+    self.start(current_app._get_current_object())
+
+  """ This is a helper method to move a player to a better score, the lock must be held """
+  def set_score(self, player, score):
+    current = self.scores.get(player)
+    if current is not None and current >= score:
+      return False
+    if current is not None:
+      self.ranking.remove((-current, player))
+    self.ranking.insert((-score, player))
+    self.scores[player] = score
+    return True
+
+  """ This method submits the score of a player (only the best one is kept), and returns the best score and its rank """
+  def submit(self, player, score):
+    with self.lock:
+      self.load()
+      if self.set_score(player, score):
+        self.dirty.add(player)
+      best = self.scores[player]
+      return best, self.ranking.rank((-best, player))
+
+  """ This method returns the 'count' best players with their score and rank (from memory only) """
+  def top(self, count):
+    with self.lock:
+      self.load()
+      return [{'rank': rank, 'player': player, 'score': -score}
+              for rank, (score, player) in enumerate(self.ranking.first(count), start=1)]
+
+  """ This method returns the best score and the rank of a player (None if the player never submitted a score) """
+  def rank(self, player):
+    with self.lock:
+      self.load()
+      score = self.scores.get(player)
+      if score is None:
+        return None
+      return {'rank': self.ranking.rank((-score, player)), 'player': player, 'score': score}
+
+  """ This method returns the number of players """
+  def size(self):
+    with self.lock:
+      self.load()
+      return len(self.ranking)
+
+  """ This method starts the background writer, the lock must be held """
+  def start(self, app):
+    if self.thread is not None:
+      return
+    self.app = app
+    self.stopping = False
+    self.thread = threading.Thread(target=self.run, name='leaderboard', daemon=True)
+    self.thread.start()
+    # Write the changed scores before the process exits
+    atexit.register(self.stop)
+
+  """ This method is the loop of the background writer """
+  def run(self):
+    refreshed = 0.0
+    while not self.stopping:
+      self.wake_up.wait(SNAPSHOT_INTERVAL)
+      self.snapshot()
+      refreshed += SNAPSHOT_INTERVAL
+      if refreshed >= REFRESH_INTERVAL:
+        refreshed = 0.0
+        self.refresh()
+
+  """ This method writes the scores that changed since the last snapshot (in one transaction, or one by one if it fails) """
+  def snapshot(self):
+    with self.lock:
+      if not self.dirty:
+        return
+      rows = [{'player': player, 'score': self.scores[player], 'updated_at': datetime.utcnow()} for player in self.dirty]
+      self.dirty = set()
+
+    with self.app.app_context():
+      try:
+        self.write(rows)
+        failed = []
+      except Exception:
+        logging.getLogger(__name__).exception('Could not write %d leaderboard scores', len(rows))
+        # Write them one by one, so a score that can't be written doesn't fail the others
+        failed = []
+        for row in rows:
+          try:
+            self.write([row])
+          except Exception:
+            failed.append(row['player'])
+
+    with self.lock:
+      for row in rows:
+        if row['player'] not in failed:
+          self.failures.pop(row['player'], None)
+      for player in failed:
+        self.failures[player] = self.failures.get(player, 0) + 1
+        if self.failures[player] < WRITE_ATTEMPTS:
+          # Write it again on the next snapshot
+          self.dirty.add(player)
+        else:
+          logging.getLogger(__name__).error('Dropped the leaderboard score of %r after %d failed writes', player, WRITE_ATTEMPTS)
+          del self.failures[player]
+
+  """ This method upserts a batch of scores, keeping the best score of every player """
+  def write(self, rows):
+    if db.engine.dialect.name == 'postgresql':
+      # One INSERT ... ON CONFLICT DO UPDATE for the whole batch
+      statement = insert(LeaderboardEntry.__table__)
+      statement = statement.on_conflict_do_update(
+        index_elements=[LeaderboardEntry.player],
+        set_={
+          # Another server process may have written a better score
+          'score': func.greatest(LeaderboardEntry.score, statement.excluded.score),
+          'updated_at': statement.excluded.updated_at
+        })
+      db.engine.execute(statement, rows)
+    else:
+      # Read the stored scores of the batch, then update the worse ones and insert the new players
+      with db.engine.begin() as connection:
+        table = LeaderboardEntry.__table__
+        stored = dict(connection.execute(db.select([table.c.player, table.c.score])
+                                         .where(table.c.player.in_([row['player'] for row in rows]))).fetchall())
+        inserts = [row for row in rows if row['player'] not in stored]
+        updates = [dict(row, key=row['player']) for row in rows
+                   if row['player'] in stored and stored[row['player']] < row['score']]
+        if inserts:
+          connection.execute(table.insert(), inserts)
+        if updates:
+          connection.execute(table.update().where(table.c.player == db.bindparam('key'))
+                             .values(score=db.bindparam('score'), updated_at=db.bindparam('updated_at')), updates)
+
+  """ This method reads the scores written by the other server processes since the last refresh """
+  def refresh(self):
+    since = self.refreshed_at - timedelta(seconds=REFRESH_SLACK)
+    refreshed_at = datetime.utcnow()
+    try:
+      with self.app.app_context():
+        rows = (db.session.query(LeaderboardEntry.player, LeaderboardEntry.score)
+                .filter(LeaderboardEntry.updated_at >= since).all())
+        db.session.remove()
+    except Exception:
+      logging.getLogger(__name__).exception('Could not read the leaderboard scores')
+      return
+
+    with self.lock:
+      for player, score in rows:
+        self.set_score(player, score)
+      self.refreshed_at = refreshed_at
+
+  """ This method stops the background writer and writes the scores that changed since the last snapshot """
+  def stop(self):
+    thread = self.thread
+    if thread is None:
+      return
+    self.stopping = True
+    self.wake_up.set()
+    thread.join()
+    self.thread = None
+    self.wake_up.clear()
+    self.snapshot()
+
+# The leaderboard shared by all the requests
+player_leaderboard = Leaderboard()
@@ -0,0 +1,100 @@
+import base64
+import binascii
+import bisect
+import json
+from flask import abort
+
+from models import Question
+
+QUESTIONS_PER_PAGE = 10
+
+""" This is a helper function to build the opaque cursor that points after a question """
+def encode_cursor(last_id):
+  # Wrap the last ID in JSON and base64 so clients treat it as an opaque token
+  # (the '=' padding is dropped so the cursor can be put in a URL as it is)
+  return base64.urlsafe_b64encode(json.dumps({'after': last_id}).encode()).decode().rstrip('=')
+
+""" This is a helper function to read the last question ID back from a cursor """
+def decode_cursor(cursor):
+  # An empty cursor starts from the first question
+  if not cursor:
+    return 0
+
+  try:
+    # Put back the '=' padding before decoding
+    after = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))['after']
+  except (binascii.Error, ValueError, KeyError, TypeError):
+    # If the cursor wasn't created by 'encode_cursor', send an error (bad request - 400)
+    abort(400)
+
+  # The cursor must hold a question ID
+  if not isinstance(after, int):
+    abort(400)
+
+  return after
+
+""" This is a helper function to paginate questions (with the answer stats of each question if 'stats' is given) """
+def paginate_questions(request, selection, stats=None):
+  # Check if the client asked for the cursor mode (the cursor may be empty for the first page)
+  cursor = request.args.get('cursor')
+
+  if cursor is not None:
+    # Seek past the last question of the previous page (WHERE id > last_id) using the primary key,
+    # so every page costs the same no matter how deep it is
+    selection = selection.filter(Question.id > decode_cursor(cursor)).order_by(None).order_by(Question.id)
+  else:
+    # Take the request's arguments to get the page number
+    page = request.args.get('page', 1, type=int)
+    # Set the offset based on the 'QUESTIONS_PER_PAGE'
+    start = (page - 1) * QUESTIONS_PER_PAGE
+
+    # Pages start at 1, so a lower page number can't have any questions
+    if start < 0:
+      return [], None
+
+    # Let the database skip to the page (LIMIT/OFFSET)
+    selection = selection.offset(start)
+
+  # Load one more question than the page size to know if there's a next page
+  current_questions = selection.limit(QUESTIONS_PER_PAGE + 1).all()
+
+  # Set the cursor to the last question of the page if there are more questions after it
+  next_cursor = None
+  if len(current_questions) > QUESTIONS_PER_PAGE:
+    current_questions = current_questions[:QUESTIONS_PER_PAGE]
+    next_cursor = encode_cursor(current_questions[-1].id)
+
+  # Use the ListInterpolation to format the questions appropriately
+  return [question.format(stats) for question in current_questions], next_cursor
+
+""" This is a helper function to paginate a sorted list of question IDs (like the ones of the in-memory search index) """
+def paginate_ids(request, ids, stats=None):
+  # Check if the client asked for the cursor mode (the cursor may be empty for the first page)
+  cursor = request.args.get('cursor')
+
+  if cursor is not None:
+    # Find where the IDs after the last question of the previous page start (binary search)
+    start = bisect.bisect_right(ids, decode_cursor(cursor))
+  else:
+    # Take the request's arguments to get the page number
+    page = request.args.get('page', 1, type=int)
+    # Set the start based on the 'QUESTIONS_PER_PAGE'
+    start = (page - 1) * QUESTIONS_PER_PAGE
+
+    # Pages start at 1, so a lower page number can't have any questions
+    if start < 0:
+      return [], None
+
+  # Only the current page questions are loaded from the database (by their primary keys)
+  page_ids = ids[start:start + QUESTIONS_PER_PAGE]
+  current_questions = []
+  if page_ids:
+    current_questions = Question.query.filter(Question.id.in_(page_ids)).order_by(Question.id).all()
+
+  # Set the cursor to the last ID of the page if there are more IDs after it
+  next_cursor = None
+  if start + QUESTIONS_PER_PAGE < len(ids):
+    next_cursor = encode_cursor(page_ids[-1])
+
+  # Use the ListInterpolation to format the questions appropriately
+  return [question.format(stats) for question in current_questions], next_cursor
@@ -0,0 +1,281 @@
+import base64
+import binascii
+import bisect
+import random
+import re
+import threading
+import time
+import zlib
+from array import array
+from itsdangerous import BadSignature, Signer
+
+from models import db, Question, listen, category_key
+from .counters import question_counter
+from .stats import question_stats
+
+# Seconds before the pools are loaded again from the database
+# (so the questions written by the other server processes can be asked too)
+POOLS_MAX_AGE = 60
+
+# Deletes of more questions than this drop the pools (they're loaded again on the next quiz) instead of updating them
+MAX_POOL_DELETES = 1000
+
+# Random picks tried before the remaining questions are listed (when almost all of them were asked)
+MAX_REJECTIONS = 16
+
+# The range of the question difficulties and how many recent answers move the adaptive difficulty
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 5
+ADAPTIVE_WINDOW = 3
+
+""" This class keeps compact pools of the question IDs of every category and difficulty in memory to choose quiz questions """
+class QuestionPools:
+  def __init__(self):
+    self.lock = threading.Lock()
+    # The question IDs by (category key, difficulty), where None stands for all categories or all difficulties
+    # (None until they're loaded)
+    self.pools = None
+    self.loaded_at = 0
+    # The version of the answer stats the difficulties were taken from, and the empirical difficulties by question ID
+    self.stats_version = None
+    self.empirical = {}
+    # The keys of the pools read by quiz sessions, which are copied before they're changed (copy-on-write)
+    self.shared = set()
+
+  """ This is a helper method to list the keys of the pools a question belongs to """
+  def keys(self, category, difficulty):
+    category = category_key(category)
+    return [(category, None), (None, None), (category, difficulty), (None, difficulty)]
+
+  """ This method reads the IDs, categories and difficulties of all questions (without loading the questions) """
+  def load(self):
+    self.pools = {}
+    self.shared = set()
+    # The questions answered often enough are pooled by their empirical difficulty instead of the editor's one
+    # (it's already in memory, so it doesn't cost any query, and the version is read first so stats recomputed
+    # while they're read make the pools load again)
+    self.stats_version = question_stats.version
+    self.empirical = question_stats.difficulties()
+    rows = db.session.query(Question.id, Question.category, Question.difficulty).order_by(Question.id)
+    for question_id, category, difficulty in rows:
+      for key in self.keys(category, self.empirical.get(question_id, difficulty)):
+        self.pools.setdefault(key, array('i')).append(question_id)
+    self.loaded_at = time.monotonic()
+
+  """ This method returns the pool of a category and a difficulty (None for all), the lock must be held """
+  def pool(self, category_id, difficulty=None):
+    # Load the pools again when they're too old or the difficulties were recalibrated
+    if (self.pools is None or time.monotonic() - self.loaded_at > POOLS_MAX_AGE or
+        self.stats_version != question_stats.version):
+      self.load()
+    return self.pools.get((None if category_id is None else category_key(category_id), difficulty), array('i'))
+
+  """ This method returns the pool of a category (None for all) to be read by a quiz session, it's never changed after
+  (the next write of the pool changes a copy of it) """
+  def share(self, category_id):
+    with self.lock:
+      pool = self.pool(category_id)
+      self.shared.add((None if category_id is None else category_key(category_id), None))
+      return pool
+
+  """ This method chooses random question IDs of a category and a difficulty that aren't excluded IDs (a set or an AskedSet) """
+  def choose(self, category_id, excluded, count=1, difficulty=None):
+    with self.lock:
+      return self.choose_from(self.pool(category_id, difficulty), excluded, count)
+
+  """ This method chooses up to 'count' distinct random question IDs from a pool that aren't excluded IDs """
+  def choose_from(self, pool, excluded, count):
+    chosen = []
+    picked = set()
+
+    # Rejection sampling: a random pick is almost always new while few questions were asked (O(1) a question)
+    for _ in range(min(MAX_REJECTIONS * count, len(pool))):
+      if len(chosen) == count:
+        return chosen
+      question_id = pool[random.randrange(len(pool))]
+      if question_id not in excluded and question_id not in picked:
+        picked.add(question_id)
+        chosen.append(question_id)
+
+    # Most of the pool was asked, so list the remaining questions and sample the rest from them
+    # (Reference: https://pynative.com/python-random-choice/)
+    remaining = [question_id for question_id in pool if question_id not in excluded and question_id not in picked]
+    return chosen + random.sample(remaining, min(count - len(chosen), len(remaining)))
+
+  """ This method returns up to 'count' distinct quiz questions of a category and a difficulty (None for all)
+  that aren't excluded, the chosen IDs are added to 'excluded' """
+  def next_questions(self, category_id, excluded, count=1, difficulty=None):
+    questions = []
+    while len(questions) < count:
+      question_ids = self.choose(category_id, excluded, count - len(questions), difficulty)
+      # Stop if all questions were asked
+      if not question_ids:
+        break
+
+      # Only the chosen questions are read from the database (in one query)
+      found = {question.id: question for question in Question.query.filter(Question.id.in_(question_ids))}
+      for question_id in question_ids:
+        excluded.add(question_id)
+        # Skip the questions deleted by another server process
+        if question_id in found:
+          questions.append(found[question_id])
+    return questions
+
+  """ This method returns the next quiz question of a category (None for all) that isn't excluded (None if all were asked) """
+  def next_question(self, category_id, excluded):
+    questions = self.next_questions(category_id, excluded)
+    return questions[0] if questions else None
+
+  """ This method updates the pools after questions are written """
+  def apply(self, action, rows):
+    with self.lock:
+      # Nothing to update if the pools aren't loaded yet
+      if self.pools is None:
+        return
+
+      if action == 'update':
+        # The category or the difficulty of a question may have changed, so load the pools again on the next quiz
+        # (unless the rows list the changed columns and none of them is the category or the difficulty)
+        if any({'category', 'difficulty'} & set(row.get('changed', ['category'])) for row in rows):
+          self.pools = None
+        return
+
+      if action == 'delete' and len(rows) > MAX_POOL_DELETES:
+        # Loading the pools again is faster than removing many IDs one at a time (and frees the lock sooner)
+        self.pools = None
+        return
+
+      # The pools are kept sorted by ID, so the IDs are found by binary search
+      for row in rows:
+        # A question answered often enough is pooled by its empirical difficulty
+        for key in self.keys(row['category'], self.empirical.get(row['id'], row['difficulty'])):
+          pool = self.pools.setdefault(key, array('i'))
+          if key in self.shared:
+            # A quiz session reads this pool, so change a copy of it (once, the copy isn't shared)
+            pool = self.pools[key] = array('i', pool)
+            self.shared.discard(key)
+          position = bisect.bisect_left(pool, row['id'])
+          if action == 'insert':
+            # The new IDs are almost always the largest ones, so this is usually an append
+            if position == len(pool) or pool[position] != row['id']:
+              pool.insert(position, row['id'])
+          elif position < len(pool) and pool[position] == row['id']:
+            del pool[position]
+
+  """ This method drops the pools so they're loaded again on the next quiz """
+  def invalidate(self):
+    with self.lock:
+      self.pools = None
+
+# The pools shared by all the quizzes, kept current by the question writes
+question_pools = QuestionPools()
+listen('questions', question_pools.apply)
+
+""" This is a helper function to move the adaptive difficulty up or down from the recent answers (True when correct) """
+def adapt_difficulty(difficulty, recent_answers):
+  recent_answers = recent_answers[-ADAPTIVE_WINDOW:]
+  if recent_answers:
+    correct = sum(1 for answer in recent_answers if answer) / len(recent_answers)
+    # Harder after mostly correct answers, easier after mostly wrong ones
+    if correct >= 2 / 3:
+      difficulty += 1
+    elif correct <= 1 / 3:
+      difficulty -= 1
+  return max(MIN_DIFFICULTY, min(MAX_DIFFICULTY, difficulty))
+
+""" This is a helper function to choose questions at the target difficulty, or the closest one that has unasked questions """
+def next_adaptive_questions(selector, category_id, excluded, count, difficulty):
+  questions = []
+  # Try the difficulties from the closest to the farthest (3, then 2 and 4, then 1 and 5...)
+  for distance in range(MAX_DIFFICULTY - MIN_DIFFICULTY + 1):
+    for candidate in sorted({difficulty - distance, difficulty + distance}):
+      if MIN_DIFFICULTY <= candidate <= MAX_DIFFICULTY and len(questions) < count:
+        questions += selector.next_questions(category_id, excluded, count - len(questions), candidate)
+  return questions
+
+""" This class is a server-side quiz that asks the questions of a category in a random order """
+class QuizSession:
+  def __init__(self, category_id, selector):
+    self.lock = threading.Lock()
+    self.category_id = category_id
+    if selector is question_pools:
+      # Read the pool of the category shared by all the sessions (it isn't copied), it's shuffled lazily
+      self.ids = question_pools.share(category_id)
+      self.total = len(self.ids)
+    else:
+      # The table is too large for the in-memory pools, so the questions are sampled inside the database
+      # and only the asked IDs are kept
+      self.ids = None
+      self.selector = selector
+      self.asked = set()
+      self.total = question_counter.total() if category_id is None else question_counter.category(category_id)
+    # The questions before the cursor were asked
+    self.cursor = 0
+    # The IDs moved by the shuffle by their position (the other positions still have the ID of the pool),
+    # so a session grows with the questions it asked, not with the pool
+    self.swaps = {}
+
+  """ This method returns the next question of the quiz (None when all questions were asked) """
+  def next_question(self):
+    with self.lock:
+      if self.ids is None:
+        questions = self.selector.next_questions(self.category_id, self.asked)
+        return questions[0] if questions else None
+
+      while self.cursor < len(self.ids):
+        # Fisher-Yates step: swap a random question of the rest of the quiz to the cursor (O(1))
+        chosen = random.randrange(self.cursor, len(self.ids))
+        question_id = self.swaps.pop(chosen, self.ids[chosen])
+        if chosen != self.cursor:
+          # The question at the cursor takes the place of the chosen one
+          self.swaps[chosen] = self.swaps.pop(self.cursor, self.ids[self.cursor])
+        self.cursor += 1
+
+        # Only the chosen question is read from the database, unless it was deleted since the quiz started
+        question = Question.query.get(question_id)
+        if question is not None:
+          return question
+      return None
+
+""" This class is a bitset of the asked question IDs (bit N is set when the question N was asked) """
+class AskedSet:
+  def __init__(self, bits=b''):
+    self.bits = bytearray(bits)
+
+  def __contains__(self, question_id):
+    index = question_id >> 3
+    return 0 <= index < len(self.bits) and bool(self.bits[index] & (1 << (question_id & 7)))
+
+  def add(self, question_id):
+    # Question IDs start at 1, so a negative ID can't be asked
+    if question_id < 0:
+      return
+    index = question_id >> 3
+    if index >= len(self.bits):
+      self.bits.extend(bytes(index + 1 - len(self.bits)))
+    self.bits[index] |= 1 << (question_id & 7)
+
+  def __iter__(self):
+    # Find the bytes that have asked IDs (the search of the non-zero bytes runs in C)
+    for match in re.finditer(b'[^\x00]', self.bits):
+      index = match.start()
+      for bit in range(8):
+        if self.bits[index] & (1 << bit):
+          yield (index << 3) | bit
+
+""" This is a helper function to write the asked questions into a signed quiz state token """
+def dump_quiz_state(asked, secret_key):
+  # The bitset has long runs of zero bytes between the asked IDs, so it compresses to a few bytes per question
+  compressed = zlib.compress(bytes(asked.bits).rstrip(b'\0'), 9)
+  token = base64.urlsafe_b64encode(compressed).rstrip(b'=')
+  # Sign the token so the client can't change it
+  return Signer(secret_key, salt='quiz-state').sign(token).decode()
+
+""" This is a helper function to read the asked questions from a quiz state token (None if it isn't valid) """
+def load_quiz_state(token, secret_key):
+  try:
+    data = Signer(secret_key, salt='quiz-state').unsign(token)
+    return AskedSet(zlib.decompress(base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))))
+  except (BadSignature, binascii.Error, zlib.error, ValueError):
+    # The signature is wrong, or the token is damaged
+    return None
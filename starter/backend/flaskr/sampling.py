@@ -0,0 +1,128 @@
+import random
+import threading
+import time
+from sqlalchemy import func, tablesample
+from sqlalchemy.orm import aliased
+
+from models import db, Question, listen
+from .counters import question_counter
+from .quiz import question_pools
+
+# Tables with more questions than this are sampled inside the database instead of kept in the in-memory pools
+POOL_MAX_QUESTIONS = 1000000
+
+# Seconds before the smallest and largest question IDs are read again
+ID_RANGE_MAX_AGE = 60
+
+# Candidate sets up to this size are shuffled by the database (ORDER BY random() LIMIT k)
+SMALL_SAMPLE = 1000
+
+# Rows a TABLESAMPLE should return for every question asked for (the sample must have enough unasked ones)
+ROWS_PER_QUESTION = 50
+
+""" This class chooses random quiz questions inside the database (for the tables too large for the in-memory pools) """
+class DatabaseSampler:
+  def __init__(self):
+    self.lock = threading.Lock()
+    # The smallest and largest question IDs (None until they're read)
+    self.id_range = None
+    self.loaded_at = 0
+
+  """ This method returns the smallest and largest question IDs (read again if 'reload' is set) """
+  def ids(self, reload=False):
+    with self.lock:
+      if reload or self.id_range is None or time.monotonic() - self.loaded_at > ID_RANGE_MAX_AGE:
+        self.id_range = db.session.query(func.min(Question.id), func.max(Question.id)).one()
+        self.loaded_at = time.monotonic()
+      return self.id_range
+
+  """ This method widens the ID range after questions are created (the deletes leave gaps the strategies already skip) """
+  def apply(self, action, rows):
+    if action != 'insert':
+      return
+    with self.lock:
+      # Nothing to update if the range isn't read yet
+      if self.id_range is None:
+        return
+      ids = [row['id'] for row in rows]
+      smallest, largest = self.id_range
+      self.id_range = (min(ids + ([] if smallest is None else [smallest])),
+                       max(ids + ([] if largest is None else [largest])))
+
+  """ This is a helper method to filter a question entity by the category, the difficulty (None for all) and the asked IDs """
+  def candidates(self, entity, category_id, excluded, difficulty=None):
+    query = db.session.query(entity)
+    if category_id is not None:
+      query = query.filter(entity.category == category_id)
+    if difficulty is not None:
+      # Uses the (category, difficulty) index
+      query = query.filter(entity.difficulty == difficulty)
+    if excluded:
+      query = query.filter(~entity.id.in_(excluded))
+    return query
+
+  """ Strategy for the small candidate sets: let the database shuffle them """
+  def order_by_random(self, category_id, excluded, count, difficulty):
+    return self.candidates(Question, category_id, excluded, difficulty).order_by(func.random()).limit(count).all()
+
+  """ Strategy for Postgres: shuffle a random sample of the table pages (TABLESAMPLE SYSTEM) """
+  def table_sample(self, category_id, excluded, count, difficulty, cardinality):
+    # Sample the percentage of the table that should hold about 'ROWS_PER_QUESTION' candidates for each question
+    percent = min(100.0, 100.0 * count * ROWS_PER_QUESTION / cardinality)
+    sample = aliased(Question, tablesample(Question.__table__, func.system(percent)))
+    questions = self.candidates(sample, category_id, excluded, difficulty).order_by(func.random()).limit(count).all()
+
+    # The sample may miss some questions (a small category, or a quiz that's almost done), so probe for the rest
+    if len(questions) < count:
+      excluded = excluded + [question.id for question in questions]
+      questions += self.id_probe(category_id, excluded, count - len(questions), difficulty)
+    return questions
+
+  """ Strategy for the other databases: probe random IDs against the primary key """
+  def id_probe(self, category_id, excluded, count, difficulty):
+    questions = []
+    excluded = list(excluded)
+    smallest, largest = self.ids()
+    if smallest is None:
+      return questions
+
+    for _ in range(count):
+      # Take the first candidate at or after a random ID, or the last one before it when there's none after
+      start = random.randint(smallest, largest)
+      query = self.candidates(Question, category_id, excluded, difficulty)
+      question = (query.filter(Question.id >= start).order_by(Question.id).first() or
+                  query.filter(Question.id < start).order_by(Question.id.desc()).first())
+      # Stop if all questions were asked
+      if question is None:
+        break
+      questions.append(question)
+      excluded.append(question.id)
+    return questions
+
+  """ This method returns up to 'count' distinct random questions of a category and a difficulty (None for all)
+  that aren't excluded, the chosen IDs are added to 'excluded' (a set or an AskedSet) """
+  def next_questions(self, category_id, excluded, count=1, difficulty=None):
+    # Choose the strategy from the cached number of candidates (of the category, whatever the difficulty)
+    cardinality = question_counter.total() if category_id is None else question_counter.category(category_id)
+    excluded_ids = list(excluded)
+
+    if cardinality <= SMALL_SAMPLE:
+      questions = self.order_by_random(category_id, excluded_ids, count, difficulty)
+    elif db.engine.dialect.name == 'postgresql':
+      questions = self.table_sample(category_id, excluded_ids, count, difficulty, cardinality)
+    else:
+      questions = self.id_probe(category_id, excluded_ids, count, difficulty)
+
+    for question in questions:
+      excluded.add(question.id)
+    return questions
+
+# The sampler shared by all the quizzes, kept current by the question writes
+database_sampler = DatabaseSampler()
+listen('questions', database_sampler.apply)
+
+""" This is a helper function to choose between the in-memory pools and the database sampling from the cached table size """
+def get_question_selector():
+  if question_counter.total() <= POOL_MAX_QUESTIONS:
+    return question_pools
+  return database_sampler
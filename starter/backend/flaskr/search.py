@@ -0,0 +1,218 @@
+import bisect
+import re
+import sys
+import threading
+import time
+from array import array
+from flask import abort, current_app
+from sqlalchemy import desc, func, inspect, literal_column
+
+from models import db, Question, listen
+from .pagination import paginate_questions, paginate_ids
+
+# The words of a text (letters, digits and underscores)
+TOKEN_PATTERN = re.compile(r'\w+')
+
+""" This is a helper function to split a text into its lowercase words """
+def tokenize(text):
+  return set(TOKEN_PATTERN.findall((text or '').lower()))
+
+""" This class has the defaults of the search backends """
+class SearchBackend:
+  def available(self):
+    return True
+
+  """ This method counts the matching questions without loading them (SELECT count(*)) """
+  def count(self, term):
+    return self.query(term).order_by(None).count()
+
+  """ This method returns the current page of the matching questions and the next page cursor """
+  def paginate(self, request, term):
+    return paginate_questions(request, self.query(term))
+
+""" This search backend finds the questions that have the search term as a substring (works on every database) """
+class IlikeSearch(SearchBackend):
+
+  def query(self, term):
+    # Use the ilike function for the search term
+    # (Reference: https://prodevsblog.com/questions/146983/case-insensitive-flask-sqlalchemy-query/)
+    return Question.query.filter(Question.question.ilike('%' + term + '%')).order_by(Question.id)
+
+""" This search backend matches the words of the search term against the indexed 'search_vector' column (Postgres) """
+class FullTextSearch(SearchBackend):
+  def __init__(self):
+    # Remember for each database if it has the 'search_vector' column (added by 'postgres_upgrades' in models.py)
+    self.checked = {}
+
+  def available(self):
+    url = str(db.engine.url)
+    if url not in self.checked:
+      self.checked[url] = (db.engine.dialect.name == 'postgresql' and
+                           'search_vector' in [column['name'] for column in inspect(db.engine).get_columns('questions')])
+    return self.checked[url]
+
+  def query(self, term):
+    # Turn the search term into a query of its words (stemmed, without stop words)
+    tsquery = func.plainto_tsquery('english', term)
+    vector = literal_column('questions.search_vector')
+    # Use the GIN index to find the matches and put the best ranked ones first
+    return (Question.query.filter(vector.op('@@')(tsquery))
+            .order_by(desc(func.ts_rank(vector, tsquery)), Question.id))
+
+  def paginate(self, request, term):
+    # The matches are ordered by rank, not by ID, so a cursor (WHERE id > last_id) would skip or repeat questions
+    if 'cursor' in request.args:
+      # Send an error (bad request - 400)
+      abort(400)
+    # Only the page numbers are supported, so there's no next page cursor
+    current_questions, _ = paginate_questions(request, self.query(term))
+    return current_questions, None
+
+""" This search backend runs the same substring search as 'IlikeSearch' through the trigram index (Postgres with pg_trgm) """
+class TrigramSearch(IlikeSearch):
+  def __init__(self):
+    # Remember for each database if it has the trigram index (added by 'postgres_upgrades' in models.py)
+    self.checked = {}
+
+  def available(self):
+    url = str(db.engine.url)
+    if url not in self.checked:
+      self.checked[url] = (db.engine.dialect.name == 'postgresql' and
+                           'ix_questions_question_trgm' in [index['name'] for index in inspect(db.engine).get_indexes('questions')])
+    return self.checked[url]
+
+  # The query is the one of 'IlikeSearch': Postgres uses the 'gin_trgm_ops' index for ILIKE '%term%'
+  # when the term has at least 3 characters, shorter terms still scan the table
+
+""" This search backend answers from an inverted index kept in memory (no database extension needed) """
+class InvertedIndexSearch(SearchBackend):
+  def __init__(self):
+    self.lock = threading.Lock()
+    # The sorted question IDs of every word (None until the index is built)
+    self.postings = None
+    # The words of every question ID, to remove a question without reading it again
+    self.words = None
+    self.build_ms = 0
+
+  """ This method builds the index from the question and answer of all questions """
+  def build(self):
+    start = time.perf_counter()
+    postings = {}
+    words = {}
+    # Read only the needed columns in ID order, so every posting array is filled already sorted
+    rows = db.session.query(Question.id, Question.question, Question.answer).order_by(Question.id).yield_per(1000)
+    for question_id, question, answer in rows:
+      question_words = tokenize(question) | tokenize(answer)
+      words[question_id] = tuple(question_words)
+      for word in question_words:
+        postings.setdefault(word, array('i')).append(question_id)
+
+    with self.lock:
+      self.postings = postings
+      self.words = words
+      self.build_ms = (time.perf_counter() - start) * 1000
+
+  """ This method returns the sorted IDs of the questions that have all the words of the search term """
+  def search_ids(self, term):
+    if self.postings is None:
+      self.build()
+
+    with self.lock:
+      # Start from the shortest posting array and keep the IDs found in all the others (binary search)
+      lists = sorted((self.postings.get(word, ()) for word in tokenize(term)), key=len)
+      if not lists:
+        return []
+      ids = []
+      for question_id in lists[0]:
+        for other in lists[1:]:
+          position = bisect.bisect_left(other, question_id)
+          if position == len(other) or other[position] != question_id:
+            break
+        else:
+          ids.append(question_id)
+      return ids
+
+  def query(self, term):
+    # Only the matching rows are read from the database (by their primary keys)
+    return Question.query.filter(Question.id.in_(self.search_ids(term))).order_by(Question.id)
+
+  def count(self, term):
+    # The index has all the matching IDs, so the database isn't needed
+    return len(self.search_ids(term))
+
+  def paginate(self, request, term):
+    # Take the page from the matching IDs, so only its questions are read from the database
+    return paginate_ids(request, self.search_ids(term))
+
+  """ This method adds a question to the index """
+  def add(self, row):
+    question_words = tokenize(row['question']) | tokenize(row['answer'])
+    self.words[row['id']] = tuple(question_words)
+    for word in question_words:
+      posting = self.postings.setdefault(word, array('i'))
+      position = bisect.bisect_left(posting, row['id'])
+      if position == len(posting) or posting[position] != row['id']:
+        posting.insert(position, row['id'])
+
+  """ This method removes a question from the index """
+  def remove(self, question_id):
+    for word in self.words.pop(question_id, ()):
+      posting = self.postings[word]
+      position = bisect.bisect_left(posting, question_id)
+      if position < len(posting) and posting[position] == question_id:
+        del posting[position]
+      if not posting:
+        del self.postings[word]
+
+  """ This method updates the index after questions are written """
+  def apply(self, action, rows):
+    with self.lock:
+      # Nothing to update if the index isn't built yet (it reads the database when it's built)
+      if self.postings is None:
+        return
+      for row in rows:
+        # Skip the updates that don't change the question or the answer (when the rows list the changed columns)
+        if action == 'update' and not {'question', 'answer'} & set(row.get('changed', ['question'])):
+          continue
+        if action != 'insert':
+          self.remove(row['id'])
+        if action != 'delete':
+          self.add(row)
+
+  """ This method returns the size of the index """
+  def stats(self):
+    with self.lock:
+      if self.postings is None:
+        return {'built': False}
+      # Count the dictionaries, the posting arrays and the word tuples (the word strings are shared)
+      memory = sys.getsizeof(self.postings) + sys.getsizeof(self.words)
+      memory += sum(sys.getsizeof(word) + sys.getsizeof(posting) for word, posting in self.postings.items())
+      memory += sum(sys.getsizeof(words) for words in self.words.values())
+      return {
+        'built': True,
+        'questions': len(self.words),
+        'words': len(self.postings),
+        'postings': sum(len(posting) for posting in self.postings.values()),
+        'memory_bytes': memory,
+        'build_ms': round(self.build_ms, 1)
+      }
+
+# The index shared by all the requests, kept current by the question writes
+search_index = InvertedIndexSearch()
+listen('questions', search_index.apply)
+
+# The search backends by the names used in the 'SEARCH_BACKEND' setting
+search_backends = {
+  'ilike': IlikeSearch(),
+  'fulltext': FullTextSearch(),
+  'trigram': TrigramSearch(),
+  'memory': search_index,
+}
+
+""" This is a helper function to get the search backend selected by the app config """
+def get_search_backend():
+  backend = search_backends.get(current_app.config['SEARCH_BACKEND'])
+  # Fall back to the ILIKE search if the backend is unknown or the database doesn't support it
+  if backend is None or not backend.available():
+    return search_backends['ilike']
+  return backend
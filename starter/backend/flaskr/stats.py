@@ -0,0 +1,179 @@
+import atexit
+import logging
+import threading
+import numpy as np
+from flask import current_app
+from sqlalchemy import Integer, cast, func
+
+from models import db, Attempt
+from .attempts import attempt_logger
+
+# Seconds between the full recomputations of the stats from the attempts table
+RECOMPUTE_INTERVAL = 300
+
+# Elo ratings: the rating of an average player (and of a new question), the update step and the scale
+BASE_RATING = 1500.0
+K_FACTOR = 16.0
+RATING_SCALE = 400.0
+
+# Rating points between two difficulty levels (1 to 5, the base rating is 3)
+RATING_PER_LEVEL = 200.0
+
+# Attempts a question needs before its empirical difficulty replaces the editor's one in the quizzes
+MIN_ATTEMPTS = 20
+
+""" This class keeps the answer counters and the Elo rating of every question in memory """
+class QuestionStats:
+  def __init__(self):
+    self.lock = threading.Lock()
+    # The [correct, total] counters and the ratings by question ID (None until they're loaded)
+    self.counts = None
+    self.ratings = None
+    # Held by the recomputation, so only one request runs the first one
+    self.recomputing = threading.RLock()
+    # Increased by every full recomputation (the quiz pools compare it to pick up the new difficulties)
+    self.version = 0
+    self.wake_up = threading.Event()
+    self.thread = None
+    self.app = None
+    self.stopping = False
+
+  """ This method recomputes the counters of all questions from the attempts table at once (and the attempts that
+  aren't written yet), and moves the ratings by the attempts the other server processes recorded since the last time """
+  def recompute(self):
+    with self.recomputing:
+      # No attempts are written while the table is read, so every attempt is either counted or still buffered
+      with attempt_logger.writing:
+        rows = (db.session.query(Attempt.question_id, func.sum(cast(Attempt.correct, Integer)), func.count(Attempt.id))
+                .group_by(Attempt.question_id).all())
+        pending = attempt_logger.pending()
+
+      counts = {question_id: [correct or 0, total] for question_id, correct, total in rows}
+      for question_id, correct, _ in pending:
+        question_counts = counts.setdefault(question_id, [0, 0])
+        question_counts[0] += 1 if correct else 0
+        question_counts[1] += 1
+
+      question_ids = list(counts)
+      correct = np.array([counts[question_id][0] for question_id in question_ids], dtype=np.float64)
+      total = np.array([counts[question_id][1] for question_id in question_ids], dtype=np.float64)
+
+      # The rating that expects the observed accuracy from an average player (smoothed, so 0% and 100% stay finite)
+      accuracy = (correct + 1) / (total + 2)
+      ratings = dict(zip(question_ids, (BASE_RATING + RATING_SCALE * np.log10((1 - accuracy) / accuracy)).tolist()))
+
+      with self.lock:
+        for question_id, known in (self.counts or {}).items():
+          correct, total = counts.get(question_id, (0, 0))
+          if total <= known[1]:
+            # Nothing new from the other server processes (the attempts recorded here since the query count already)
+            counts[question_id] = known
+            ratings[question_id] = self.ratings[question_id]
+            continue
+          # Keep the Elo rating and move it by the attempts of the other server processes (at their accuracy)
+          rating = self.ratings[question_id]
+          result = (correct - known[0]) / (total - known[1])
+          for _ in range(total - known[1]):
+            expected = 1 / (1 + 10 ** ((rating - BASE_RATING) / RATING_SCALE))
+            rating += K_FACTOR * (expected - result)
+          ratings[question_id] = rating
+        self.counts = counts
+        self.ratings = ratings
+        self.version += 1
+
+  """ This method loads the stats the first time they're needed and starts the background recomputation """
+  def refresh(self):
+    if self.counts is None:
+      with self.recomputing:
+        # Another request may have loaded them while this one waited
+        if self.counts is None:
+          self.recompute()
+    self.start(current_app._get_current_object())
+
+  """ This method starts the background recomputation """
+  def start(self, app):
+    with self.lock:
+      if self.thread is not None:
+        return
+      self.app = app
+      self.stopping = False
+      self.thread = threading.Thread(target=self.run, name='question-stats', daemon=True)
+      self.thread.start()
+    atexit.register(self.stop)
+
+  """ This method is the loop of the background recomputation (so the requests never wait for it) """
+  def run(self):
+    failed = False
+    while not self.stopping:
+      # The first recomputation runs right away when the stats aren't loaded yet (see 'difficulties')
+      if self.counts is not None or failed:
+        self.wake_up.wait(RECOMPUTE_INTERVAL)
+        if self.stopping:
+          return
+      try:
+        with self.app.app_context():
+          self.recompute()
+          # The thread's session isn't used again until the next recomputation
+          db.session.remove()
+        failed = False
+      except Exception:
+        logging.getLogger(__name__).exception('Could not recompute the question stats')
+        failed = True
+
+  """ This method stops the background recomputation """
+  def stop(self):
+    thread = self.thread
+    if thread is None:
+      return
+    self.stopping = True
+    self.wake_up.set()
+    thread.join()
+    self.thread = None
+    self.wake_up.clear()
+
+  """ This method updates the counters and the rating of a question after an answer (True when correct) """
+  def record(self, question_id, correct):
+    self.refresh()
+    with self.lock:
+      counts = self.counts.setdefault(question_id, [0, 0])
+      counts[0] += 1 if correct else 0
+      counts[1] += 1
+
+      # Elo step: the question "wins" against an average player when the answer is wrong
+      rating = self.ratings.get(question_id, BASE_RATING)
+      expected = 1 / (1 + 10 ** ((rating - BASE_RATING) / RATING_SCALE))
+      self.ratings[question_id] = rating + K_FACTOR * (expected - (1 if correct else 0))
+
+  """ This is a helper method to turn a rating into a difficulty from 1 to 5 """
+  def level(self, rating):
+    return int(max(1, min(5, round(3 + (rating - BASE_RATING) / RATING_PER_LEVEL))))
+
+  """ This method returns the stats of a question (None if it was never answered) """
+  def get(self, question_id):
+    self.refresh()
+    with self.lock:
+      counts = self.counts.get(question_id)
+      if counts is None:
+        return None
+      rating = self.ratings[question_id]
+      return {
+        'correct': counts[0],
+        'total': counts[1],
+        'accuracy': round(counts[0] / counts[1], 4) if counts[1] else None,
+        'rating': round(rating, 1),
+        'empirical_difficulty': self.level(rating)
+      }
+
+  """ This method returns the empirical difficulties of the questions answered at least 'MIN_ATTEMPTS' times """
+  def difficulties(self):
+    # The quiz pools ask for them while holding their lock, so they don't wait for the first recomputation:
+    # it runs in the background, and its new version makes the pools load again with the difficulties
+    self.start(current_app._get_current_object())
+    with self.lock:
+      if self.counts is None:
+        return {}
+      return {question_id: self.level(self.ratings[question_id])
+              for question_id, counts in self.counts.items() if counts[1] >= MIN_ATTEMPTS}
+
+# The stats shared by all the requests
+question_stats = QuestionStats()
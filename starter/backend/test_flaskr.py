@@ -3,8 +3,11 @@ import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
 
-from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr import create_app, sampling, search
+from flaskr.attempts import attempt_logger
+from flaskr.ingest import question_ingest
+from flaskr.quiz import question_pools
+from models import setup_db, Question, Category, Attempt
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -68,6 +71,21 @@ class TriviaTestCase(unittest.TestCase):
     Write at least one test for each test for successful operation and for expected errors.
     """
 
+    # TEST (Successful Operation): GET /categories
+    def test_get_categories(self):
+        # Store the response in the 'res' variable (twice, so the second one is served by the category cache)
+        self.client().get('/categories')
+        res = self.client().get('/categories')
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the success body is true
+        self.assertEqual(data['success'], True)
+        # Check the categories body has the category 1 (Science)
+        self.assertEqual(data['categories']['1'], 'Science')
+
     # TEST (Successful Operation): GET /questions
     def test_get_paginated_questions(self):
         # Store the response in the 'res' variable
@@ -98,6 +116,50 @@ class TriviaTestCase(unittest.TestCase):
         # Check the message body
         self.assertEqual(data['message'], 'Resource Not Found')
 
+    # TEST (Successful Operation): GET /questions?page=2
+    def test_get_questions_page_size(self):
+        # Store the response in the 'res' variable
+        res = self.client().get('/questions?page=2')
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the page has no more than 10 questions
+        self.assertLessEqual(len(data['questions']), 10)
+        # Check the page starts after the first 10 questions (the total counts all questions)
+        self.assertGreater(data['total_questions'], 10)
+
+    # TEST (Successful Operation): GET /questions?cursor=<next_cursor>
+    def test_get_questions_by_cursor(self):
+        # Get the first page to take its next page cursor
+        first_page = json.loads(self.client().get('/questions').data)
+        # Store the response in the 'res' variable (request the next page by the cursor)
+        res = self.client().get('/questions?cursor=' + first_page['next_cursor'])
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the success body is true
+        self.assertEqual(data['success'], True)
+        # Check the page continues after the last question of the first page
+        self.assertGreater(data['questions'][0]['id'], first_page['questions'][-1]['id'])
+
+    # TEST (Expected Error): GET /questions?cursor=invalid (400: Bad Request)
+    def test_400_if_cursor_is_invalid(self):
+        # Store the response in the 'res' variable
+        res = self.client().get('/questions?cursor=invalid')
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 400
+        self.assertEqual(res.status_code, 400)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+        # Check the message body
+        self.assertEqual(data['message'], 'Bad Request')
+
     # TEST (Successful Operation): DELETE /questions/5
     def test_delete_question(self):
         # Store the response in the 'res' variable (delete question 5)
@@ -131,6 +193,97 @@ class TriviaTestCase(unittest.TestCase):
         # Check the message body
         self.assertEqual(data['message'], 'Resource Not Found')
         
+    # TEST (Successful Operation): DELETE /questions by IDs and by a filter
+    def test_delete_questions_in_bulk(self):
+        # Create three questions (the last one with another difficulty)
+        created = json.loads(self.client().post('/questions/bulk', json=[
+            self.new_question, self.new_question, dict(self.new_question, difficulty=5)]).data)['created']
+        # Get the number of total questions before deleting them
+        total_before = json.loads(self.client().get('/questions').data)['total_questions']
+        # Store the response in the 'res' variable (delete the first two by their IDs)
+        res = self.client().delete('/questions', json={'ids': created[:2]})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+        # Delete the last one by an ID range and its difficulty
+        res_filter = self.client().delete('/questions', json={'min_id': created[2], 'max_id': created[2], 'difficulty': 5})
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the deleted questions
+        self.assertEqual(data['deleted'], created[:2])
+        self.assertEqual(json.loads(res_filter.data)['deleted'], created[2:])
+        # Check the counter of the total questions is updated
+        self.assertEqual(json.loads(self.client().get('/questions').data)['total_questions'], total_before - 3)
+
+    # TEST (Expected Error): DELETE /questions without IDs or a filter (422: Unprocessable)
+    def test_422_if_bulk_delete_has_no_filter(self):
+        # Store the response in the 'res' variable
+        res = self.client().delete('/questions', json={})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 422
+        self.assertEqual(res.status_code, 422)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+
+    # TEST (Successful Operation): PATCH /questions/<id> with the version in If-Match
+    def test_update_question(self):
+        # Create a new question (at version 1)
+        created = json.loads(self.client().post('/questions', json=self.new_question).data)['created']
+        # Store the response in the 'res' variable (change only the answer)
+        res = self.client().patch('/questions/{}'.format(created), json={'answer': 'Mercury Planet'}, headers={'If-Match': '"1"'})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the answer changed, the other fields didn't, and the version moved to 2
+        self.assertEqual(data['question']['answer'], 'Mercury Planet')
+        self.assertEqual(data['question']['question'], self.new_question['question'])
+        self.assertEqual(data['question']['version'], 2)
+        self.assertEqual(res.headers['ETag'], '"2"')
+        # Check the new answer is accepted by the answer checking
+        answer = self.client().post('/quizzes/answer', json={'question_id': created, 'answer': 'mercury planet'})
+        self.assertEqual(json.loads(answer.data)['correct'], True)
+
+    # TEST (Successful Operation): PATCH /questions/<id> with aliases on a question without a normalized answer
+    def test_update_aliases_of_question_without_normalized_answer(self):
+        # Create a new question and drop its normalized answer (like the questions created before it existed)
+        created = json.loads(self.client().post('/questions', json=self.new_question).data)['created']
+        with self.app.app_context():
+            question = Question.query.get(created)
+            question.normalized_answer = None
+            question.update()
+        # Store the response in the 'res' variable (change only the aliases, and the category sent as text)
+        res = self.client().patch('/questions/{}'.format(created), json={'aliases': ['The Red Planet'], 'category': '2'})
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the category was stored
+        self.assertEqual(json.loads(res.data)['question']['category'], '2')
+        # Check both the answer and the new alias are accepted by the answer checking
+        for answer in (self.new_question['answer'], 'red planet'):
+            checked = self.client().post('/quizzes/answer', json={'question_id': created, 'answer': answer})
+            self.assertEqual(json.loads(checked.data)['correct'], True)
+
+    # TEST (Expected Error): PATCH /questions/<id> with an old version (412: Precondition Failed)
+    def test_412_if_question_version_is_old(self):
+        # Create a new question and update it once (it moves to version 2)
+        created = json.loads(self.client().post('/questions', json=self.new_question).data)['created']
+        self.client().patch('/questions/{}'.format(created), json={'difficulty': 2})
+        # Store the response in the 'res' variable (an edit of version 1)
+        res = self.client().patch('/questions/{}'.format(created), json={'difficulty': 3, 'version': 1})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 412
+        self.assertEqual(res.status_code, 412)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+        # Check the message body
+        self.assertEqual(data['message'], 'Precondition Failed')
+
     # TEST (Successful Operation): POST /questions
     def test_create_new_question(self):
         # Store the response in the 'res' variable 
@@ -145,6 +298,146 @@ class TriviaTestCase(unittest.TestCase):
         # Assert true that there is a created value 
         self.assertTrue(data['created'])
 
+    # TEST (Successful Operation): POST /questions updates the total_questions of GET /questions
+    def test_total_questions_counts_new_question(self):
+        # Get the number of total questions before creating a question
+        total_before = json.loads(self.client().get('/questions').data)['total_questions']
+        # Create a new question
+        self.client().post('/questions', json=self.new_question)
+        # Store the response in the 'res' variable
+        res = self.client().get('/questions')
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the new question is counted
+        self.assertEqual(data['total_questions'], total_before + 1)
+
+    # TEST (Successful Operation): POST /questions/bulk with a JSON array and NDJSON
+    def test_create_questions_in_bulk(self):
+        # Store the response in the 'res' variable (two valid rows and one without an answer)
+        res = self.client().post('/questions/bulk', json=[self.new_question, dict(self.new_question, answer=''), self.new_question])
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+        # The same rows, one question per line
+        res_ndjson = self.client().post('/questions/bulk', content_type='application/x-ndjson',
+                                        data='\n'.join(json.dumps(row) for row in [self.new_question, self.new_question]))
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the valid rows are created and the other one is reported without stopping the import
+        self.assertEqual(data['total_created'], 2)
+        self.assertEqual(data['total_errors'], 1)
+        self.assertEqual(data['errors'][0]['index'], 1)
+        self.assertEqual(json.loads(res_ndjson.data)['total_created'], 2)
+
+    # TEST (Successful Operation): POST /questions/bulk reports the rows it couldn't read after a malformed one
+    def test_bulk_reports_rows_after_malformed_row(self):
+        # Store the response in the 'res' variable (a valid row, a malformed one and a valid one)
+        body = '[{}, {{bad}}, {}]'.format(json.dumps(self.new_question), json.dumps(self.new_question))
+        res = self.client().post('/questions/bulk', data=body, content_type='application/json')
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the first row is created and the error covers the malformed row and the rows after it
+        self.assertEqual(data['total_created'], 1)
+        self.assertEqual(data['errors'][0]['index'], 1)
+        self.assertIn('rows after it', data['errors'][0]['error'])
+
+    # TEST (Expected Error): POST /questions/bulk with a body that isn't an array (400: Bad Request)
+    def test_400_if_bulk_body_is_not_array(self):
+        # Store the response in the 'res' variable
+        res = self.client().post('/questions/bulk', json=self.new_question)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 400
+        self.assertEqual(res.status_code, 400)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+
+    # TEST (Successful Operation): POST /questions in the async ingest mode and GET /questions/tickets/<ticket>
+    def test_create_question_async(self):
+        # Create an app that queues the new questions
+        app = create_app({'ASYNC_INGEST': True})
+        setup_db(app, self.database_path)
+        # Store the response in the 'res' variable
+        res = app.test_client().post('/questions', json=self.new_question)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+        # Stop the writer, so the queued questions are written
+        question_ingest.stop()
+
+        # Check the status code is 202
+        self.assertEqual(res.status_code, 202)
+        # Check the ticket resolves to the created question
+        status = json.loads(app.test_client().get('/questions/tickets/{}'.format(data['ticket'])).data)
+        self.assertEqual(status['status'], 'created')
+        with app.app_context():
+            self.assertEqual(Question.query.get(status['created']).question, self.new_question['question'])
+
+    # TEST (Expected Error): GET /questions/tickets/<ticket> for an unknown ticket (404: Resource is not found)
+    def test_404_if_ticket_does_not_exist(self):
+        # Store the response in the 'res' variable
+        res = self.client().get('/questions/tickets/unknown')
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 404
+        self.assertEqual(res.status_code, 404)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+        # Check the message body
+        self.assertEqual(data['message'], 'Resource Not Found')
+
+    # TEST (Successful Operation): POST /questions retried with the same Idempotency-Key
+    def test_create_question_idempotency_key(self):
+        # Get the number of total questions before creating a question
+        total_before = json.loads(self.client().get('/questions').data)['total_questions']
+        # Send the same request twice with the same key
+        first = self.client().post('/questions', json=self.new_question, headers={'Idempotency-Key': 'test-retry'})
+        # Store the response in the 'res' variable
+        res = self.client().post('/questions', json=self.new_question, headers={'Idempotency-Key': 'test-retry'})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the retry got the first response again, without creating another question
+        self.assertEqual(data['created'], json.loads(first.data)['created'])
+        self.assertEqual(res.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(json.loads(self.client().get('/questions').data)['total_questions'], total_before + 1)
+
+    # TEST (Expected Error): POST /questions with an empty Idempotency-Key (400: Bad Request)
+    def test_400_if_idempotency_key_is_empty(self):
+        # Store the response in the 'res' variable
+        res = self.client().post('/questions', json=self.new_question, headers={'Idempotency-Key': ' '})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 400
+        self.assertEqual(res.status_code, 400)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+
+    # TEST (Expected Error): POST /questions reusing an Idempotency-Key with another body (422: Unprocessable)
+    def test_422_if_idempotency_key_is_reused_with_another_body(self):
+        # Create a question with a key
+        self.client().post('/questions', json=self.new_question, headers={'Idempotency-Key': 'test-reused'})
+        # Store the response in the 'res' variable (the same key with another question)
+        res = self.client().post('/questions', json=dict(self.new_question, question='Another question?'),
+                                 headers={'Idempotency-Key': 'test-reused'})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 422
+        self.assertEqual(res.status_code, 422)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+
     # TEST (Expected Error): POST /questions/10 (405: Method not allowed)
     def test_405_if_question_creation_not_allowed(self):
         # Store the response in the 'res' variable
@@ -189,6 +482,115 @@ class TriviaTestCase(unittest.TestCase):
         # Assert true that there is a number of total questions
         self.assertTrue(data['total_questions'])
 
+    # TEST (Successful Operation): POST /questions/search?page=1
+    def test_search_questions_first_page(self):
+        # Store the response in the 'res' variable (search a common word and ask for the first page only)
+        res = self.client().post('/questions/search?page=1', json={'searchTerm': 'the'})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the page has no more than 10 questions
+        self.assertLessEqual(len(data['questions']), 10)
+        # Check the total counts all the matching questions, not only the page
+        self.assertGreaterEqual(data['total_questions'], len(data['questions']))
+
+    # TEST (Successful Operation): GET /questions/search/cache
+    def test_search_cache_hit(self):
+        # Search the same term twice (the second search is answered from the search cache)
+        self.client().post('/questions/search', json=self.search_term)
+        self.client().post('/questions/search', json=self.search_term)
+        # Store the response in the 'res' variable
+        res = self.client().get('/questions/search/cache')
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the success body is true
+        self.assertEqual(data['success'], True)
+        # Check the second search was a hit
+        self.assertEqual(data['cache']['hits'], 1)
+
+    # TEST (Successful Operation): POST /questions/search with more results than the search cache keeps
+    def test_search_cache_skips_large_results(self):
+        # Create an app that caches the results of one question at most
+        app = create_app({'SEARCH_CACHE_MAX_QUESTIONS': 1})
+        setup_db(app, self.database_path)
+        # Search a term that matches many questions twice (without a page, so all of them are returned)
+        first = app.test_client().post('/questions/search', json={'searchTerm': 'a'})
+        app.test_client().post('/questions/search', json={'searchTerm': 'a'})
+        # Store the response in the 'res' variable
+        res = app.test_client().get('/questions/search/cache')
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the search matched more questions than the cap
+        self.assertGreater(json.loads(first.data)['total_questions'], 1)
+        # Check the results weren't cached, so the second search was a miss too
+        self.assertEqual(data['cache']['size'], 0)
+        self.assertEqual(data['cache']['hits'], 0)
+
+    # TEST (Successful Operation): POST /questions/search with the ilike search backend
+    def test_search_questions_by_substring(self):
+        # Create an app that uses the ilike search backend
+        app = create_app({'SEARCH_BACKEND': 'ilike'})
+        setup_db(app, self.database_path)
+        # Store the response in the 'res' variable (search a part of a word)
+        res = app.test_client().post('/questions/search', json={'searchTerm': 'itle'})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check all the result questions have the search term
+        self.assertTrue(all('itle' in question['question'].lower() for question in data['questions']))
+        # Assert true that there is a number of total questions
+        self.assertTrue(data['total_questions'])
+
+    # TEST (Expected Error): POST /questions/search with a cursor on the ranked full-text search (400: Bad Request)
+    def test_400_if_cursor_with_fulltext_search(self):
+        # Create an app that uses the full-text search backend
+        app = create_app({'SEARCH_BACKEND': 'fulltext'})
+        setup_db(app, self.database_path)
+        # The full-text search needs the 'search_vector' column (Postgres 12 or later)
+        with app.app_context():
+            if not search.FullTextSearch().available():
+                self.skipTest('the test database has no search_vector column')
+        # Store the responses in the 'res' variables (a page number, then a cursor)
+        res_page = app.test_client().post('/questions/search?page=1', json=self.search_term)
+        res = app.test_client().post('/questions/search?cursor=', json=self.search_term)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the page has no next page cursor (the ranked order can't be followed with one)
+        self.assertEqual(res_page.status_code, 200)
+        self.assertEqual(json.loads(res_page.data)['next_cursor'], None)
+        # Check the status code is 400
+        self.assertEqual(res.status_code, 400)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+
+    # TEST (Successful Operation): POST /questions/search with the in-memory search backend
+    def test_search_questions_in_memory(self):
+        # Create an app that uses the in-memory search backend and build its index from the test database
+        app = create_app({'SEARCH_BACKEND': 'memory'})
+        setup_db(app, self.database_path)
+        app.test_client().post('/questions/search/index')
+        # Store the response in the 'res' variable
+        res = app.test_client().post('/questions/search', json=self.search_term)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Assert true that there are questions in the data list
+        self.assertTrue(len(data['questions']))
+        # Check the index stats have the questions
+        stats = json.loads(app.test_client().get('/questions/search/index').data)['index']
+        self.assertTrue(stats['questions'])
+
     # TEST (Expected Error): POST /questions/search (422: Unprocessable)
     def test_422_if_empty_search_term(self):
         # Store the response in the 'res' variable
@@ -247,6 +649,296 @@ class TriviaTestCase(unittest.TestCase):
         # Check the success body is true
         self.assertEqual(data['success'], True)
 
+    # TEST (Successful Operation): POST /quizzes doesn't repeat the previous questions
+    def test_play_quiz_skips_previous_questions(self):
+        # Store the response in the 'res' variable (questions 20 and 21 of Science were asked)
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'type': 'Science', 'id': 1},
+            'previous_questions': [20, 21]
+        })
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the question is a new Science question
+        self.assertNotIn(data['question']['id'], [20, 21])
+        self.assertEqual(int(data['question']['category']), 1)
+
+    # TEST (Successful Operation): POST /quizzes with n=3
+    def test_play_quiz_batch(self):
+        # Store the response in the 'res' variable (ask for 3 questions at once)
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'type': 'click', 'id': 0},
+            'previous_questions': [],
+            'n': 3
+        })
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check there are 3 different questions
+        self.assertEqual(len(set(question['id'] for question in data['questions'])), 3)
+
+    # TEST (Expected Error): POST /quizzes with n=1000 (422: Unprocessable)
+    def test_422_if_quiz_batch_is_too_large(self):
+        # Store the response in the 'res' variable
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'type': 'click', 'id': 0},
+            'previous_questions': [],
+            'n': 1000
+        })
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 422
+        self.assertEqual(res.status_code, 422)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+        # Check the message body
+        self.assertEqual(data['message'], 'Not Processable')
+
+    # TEST (Successful Operation): POST /quizzes sampling inside the database
+    def test_play_quiz_with_database_sampling(self):
+        # Make the table count as too large for the in-memory pools
+        pool_max_questions = sampling.POOL_MAX_QUESTIONS
+        sampling.POOL_MAX_QUESTIONS = 0
+        try:
+            # Store the response in the 'res' variable (questions 20 and 21 of Science were asked)
+            res = self.client().post('/quizzes', json={
+                'quiz_category': {'type': 'Science', 'id': 1},
+                'previous_questions': [20, 21]
+            })
+        finally:
+            sampling.POOL_MAX_QUESTIONS = pool_max_questions
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the question is a new Science question
+        self.assertNotIn(data['question']['id'], [20, 21])
+        self.assertEqual(int(data['question']['category']), 1)
+
+    # TEST (Successful Operation): POST /quizzes in the adaptive mode
+    def test_play_adaptive_quiz(self):
+        # Store the response in the 'res' variable (the last 3 answers at difficulty 2 were correct)
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'type': 'click', 'id': 0},
+            'previous_questions': [],
+            'adaptive': True,
+            'difficulty': 2,
+            'recent_answers': [True, True, True]
+        })
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the difficulty moved up
+        self.assertEqual(data['difficulty'], 3)
+        # Check the question has the new difficulty (there are questions of difficulty 3), which is the empirical
+        # difficulty the quiz pools took for it once it was answered often enough
+        difficulty = question_pools.empirical.get(data['question']['id'], data['question']['difficulty'])
+        self.assertEqual(difficulty, 3)
+
+    # TEST (Successful Operation): POST /quizzes with the quiz_state token
+    def test_play_quiz_with_quiz_state(self):
+        # Play the first question and take the quiz state token
+        first = json.loads(self.client().post('/quizzes', json=self.new_quiz).data)
+        # Store the response in the 'res' variable (send the token instead of the previous questions)
+        res = self.client().post('/quizzes', json={
+            'quiz_category': self.new_quiz['quiz_category'],
+            'quiz_state': first['quiz_state']
+        })
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the first question isn't asked again
+        self.assertNotEqual(data['question']['id'], first['question']['id'])
+
+    # TEST (Expected Error): POST /quizzes with a changed quiz_state token (400: Bad Request)
+    def test_400_if_quiz_state_is_not_signed(self):
+        # Store the response in the 'res' variable
+        res = self.client().post('/quizzes', json={
+            'quiz_category': self.new_quiz['quiz_category'],
+            'quiz_state': 'eNr79x8I7AEUKwU6.invalid'
+        })
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 400
+        self.assertEqual(res.status_code, 400)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+        # Check the message body
+        self.assertEqual(data['message'], 'Bad Request')
+
+    # TEST (Successful Operation): POST /quizzes ignores the previous question IDs that can't exist
+    def test_play_quiz_ignores_unknown_previous_questions(self):
+        # Store the response in the 'res' variable (a huge ID would grow the quiz state token)
+        res = self.client().post('/quizzes', json={
+            'quiz_category': self.new_quiz['quiz_category'],
+            'previous_questions': [10 ** 12]
+        })
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the quiz state token stays small
+        self.assertLess(len(data['quiz_state']), 200)
+
+    # TEST (Successful Operation): POST /quizzes with a question created after the quiz started as a previous question
+    def test_play_quiz_excludes_new_previous_question(self):
+        # Play once, so the largest question ID is read, then create a question
+        self.client().post('/quizzes', json=self.new_quiz)
+        created = json.loads(self.client().post('/questions', json=self.new_question).data)['created']
+        # Get the other questions of its category to list them all as asked
+        with self.app.app_context():
+            previous = [question.id for question in Question.query.filter(Question.category == '1')]
+        # Store the response in the 'res' variable
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'type': 'Science', 'id': 1},
+            'previous_questions': previous
+        })
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the new question isn't asked again (all the questions of the category were asked)
+        self.assertIn(created, previous)
+        self.assertEqual(data['question'], None)
+
+    # TEST (Expected Error): POST /quizzes with a quiz_state that isn't a text (400: Bad Request)
+    def test_400_if_quiz_state_is_not_text(self):
+        # Store the response in the 'res' variable
+        res = self.client().post('/quizzes', json={
+            'quiz_category': self.new_quiz['quiz_category'],
+            'quiz_state': 123
+        })
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 400
+        self.assertEqual(res.status_code, 400)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+
+    # TEST (Successful Operation): POST /quizzes/answer
+    def test_check_answer(self):
+        # Create a question with an alias
+        created = json.loads(self.client().post('/questions', json=dict(self.new_question, aliases=['Planet Mercury'])).data)['created']
+        # Store the responses in the 'res' variables (answer with another case, punctuation and the alias)
+        res = self.client().post('/quizzes/answer', json={'question_id': created, 'answer': 'mercury!'})
+        res_alias = self.client().post('/quizzes/answer', json={'question_id': created, 'answer': 'planet mercury'})
+        res_wrong = self.client().post('/quizzes/answer', json={'question_id': created, 'answer': 'Venus'})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the answers are checked right
+        self.assertEqual(data['correct'], True)
+        self.assertEqual(json.loads(res_alias.data)['correct'], True)
+        self.assertEqual(json.loads(res_wrong.data)['correct'], False)
+
+    # TEST (Successful Operation): POST /quizzes/answer logs the attempt
+    def test_answer_attempt_is_logged(self):
+        # Count the attempts of question 20 before answering it
+        with self.app.app_context():
+            attempts_before = Attempt.query.filter(Attempt.question_id == 20).count()
+        # Store the response in the 'res' variable
+        res = self.client().post('/quizzes/answer', json={'question_id': 20, 'answer': 'The Liver'})
+        # Stop the attempt logger, so the buffered attempts are written
+        attempt_logger.stop()
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the attempt was written
+        with self.app.app_context():
+            self.assertEqual(Attempt.query.filter(Attempt.question_id == 20).count(), attempts_before + 1)
+
+    # TEST (Expected Error): POST /quizzes/answer for a question that doesn't exist (404: Resource is not found)
+    def test_404_if_answered_question_does_not_exist(self):
+        # Store the response in the 'res' variable
+        res = self.client().post('/quizzes/answer', json={'question_id': 1000, 'answer': 'Mercury'})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 404
+        self.assertEqual(res.status_code, 404)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+        # Check the message body
+        self.assertEqual(data['message'], 'Resource Not Found')
+
+    # TEST (Successful Operation): POST /quizzes/report updates the question stats
+    def test_report_answer(self):
+        # Read the stats of question 20 before reporting an answer
+        before = json.loads(self.client().get('/questions/20/stats').data)['question']['stats']
+        # Store the response in the 'res' variable
+        res = self.client().post('/quizzes/report', json={'question_id': 20, 'correct': False})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the counters moved by one wrong answer
+        self.assertEqual(data['stats']['total'], (before['total'] if before else 0) + 1)
+        self.assertEqual(data['stats']['correct'], before['correct'] if before else 0)
+        # Check the empirical difficulty is between 1 and 5
+        self.assertTrue(1 <= data['stats']['empirical_difficulty'] <= 5)
+        # Check the stats are added to the listed questions when asked for
+        self.assertIn('stats', json.loads(self.client().get('/questions?stats=true').data)['questions'][0])
+
+    # TEST (Expected Error): POST /quizzes/report without the result (422: Unprocessable)
+    def test_422_if_report_is_missing_result(self):
+        # Store the response in the 'res' variable
+        res = self.client().post('/quizzes/report', json={'question_id': 20})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 422
+        self.assertEqual(res.status_code, 422)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+
+    # TEST (Successful Operation): POST /quizzes/sessions and POST /quizzes/sessions/<id>/next
+    def test_play_quiz_session(self):
+        # Create a quiz session of the Science category
+        session = json.loads(self.client().post('/quizzes/sessions', json=self.new_quiz).data)
+        # Store the response in the 'res' variable (ask all the questions of the session)
+        asked = []
+        for _ in range(session['total_questions']):
+            res = self.client().post('/quizzes/sessions/{}/next'.format(session['session_id']))
+            # Load the data using json.loads of the response
+            data = json.loads(res.data)
+            asked.append(data['question']['id'])
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check no question was asked twice
+        self.assertEqual(len(asked), len(set(asked)))
+
+    # TEST (Expected Error): POST /quizzes/sessions/unknown/next (404: Resource is not found)
+    def test_404_if_quiz_session_does_not_exist(self):
+        # Store the response in the 'res' variable
+        res = self.client().post('/quizzes/sessions/unknown/next')
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 404
+        self.assertEqual(res.status_code, 404)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+        # Check the message body
+        self.assertEqual(data['message'], 'Resource Not Found')
+
     # TEST (Expected Error): POST /quizzes (422: Unprocessable)
     def test_422_if_empty_quiz_category(self):
         # Store the response in the 'res' variable (send json with empty quiz_category)
@@ -261,6 +953,56 @@ class TriviaTestCase(unittest.TestCase):
         # Check the message body
         self.assertEqual(data['message'], 'Not Processable')
 
+    # TEST (Successful Operation): POST /leaderboard, GET /leaderboard and GET /leaderboard/<player>
+    def test_leaderboard(self):
+        # Submit the scores of two players (only the best score of a player is kept)
+        self.client().post('/leaderboard', json={'player': 'test-second', 'score': 1000000})
+        self.client().post('/leaderboard', json={'player': 'test-first', 'score': 1000001})
+        # Store the response in the 'res' variable (a worse score of the first player)
+        res = self.client().post('/leaderboard', json={'player': 'test-first', 'score': 5})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the best score is kept and ranked first
+        self.assertEqual(data['score'], 1000001)
+        self.assertEqual(data['rank'], 1)
+        # Check the top players and the rank of the second player
+        top = json.loads(self.client().get('/leaderboard?limit=2').data)['players']
+        self.assertEqual([player['player'] for player in top], ['test-first', 'test-second'])
+        self.assertEqual(json.loads(self.client().get('/leaderboard/test-second').data)['rank'], 2)
+
+    # TEST (Expected Error): POST /leaderboard with a score the score column can't store (422: Unprocessable)
+    def test_422_if_score_is_out_of_range(self):
+        # Store the responses in the 'res' variables (a boolean and a score larger than the Integer column)
+        res_bool = self.client().post('/leaderboard', json={'player': 'test-range', 'score': True})
+        res = self.client().post('/leaderboard', json={'player': 'test-range', 'score': 10 ** 20})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status codes are 422
+        self.assertEqual(res_bool.status_code, 422)
+        self.assertEqual(res.status_code, 422)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+        # Check the player wasn't ranked
+        self.assertEqual(self.client().get('/leaderboard/test-range').status_code, 404)
+
+    # TEST (Expected Error): GET /leaderboard/<player> for a player without a score (404: Resource is not found)
+    def test_404_if_player_has_no_score(self):
+        # Store the response in the 'res' variable
+        res = self.client().get('/leaderboard/nobody-played')
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 404
+        self.assertEqual(res.status_code, 404)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+        # Check the message body
+        self.assertEqual(data['message'], 'Resource Not Found')
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
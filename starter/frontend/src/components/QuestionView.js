@@ -14,6 +14,7 @@ class QuestionView extends Component {
       totalQuestions: 0,
       categories: {},
       currentCategory: null,
+      searchTerm: null,
     }
   }
 
@@ -30,7 +31,8 @@ class QuestionView extends Component {
           questions: result.questions,
           totalQuestions: result.total_questions,
           categories: result.categories,
-          currentCategory: result.current_category })
+          currentCategory: result.current_category,
+          searchTerm: null })
         return;
       },
       error: (error) => {
@@ -41,7 +43,7 @@ class QuestionView extends Component {
   }
 
   selectPage(num) {
-    this.setState({page: num}, () => this.getQuestions());
+    this.setState({page: num}, () => this.state.searchTerm ? this.getSearchResults() : this.getQuestions());
   }
 
   createPagination(){
@@ -66,7 +68,8 @@ class QuestionView extends Component {
         this.setState({
           questions: result.questions,
           totalQuestions: result.total_questions,
-          currentCategory: result.current_category })
+          currentCategory: result.current_category,
+          searchTerm: null })
         return;
       },
       error: (error) => {
@@ -77,13 +80,18 @@ class QuestionView extends Component {
   }
 
   submitSearch = (searchTerm) => {
+    this.setState({searchTerm: searchTerm, page: 1}, () => this.getSearchResults());
+  }
+
+  getSearchResults = () => {
     $.ajax({
       //Changed the URL to diffrentiate between POST for new question and POST for search
-      url: '/questions/search', 
+      //Only the current page of the results is requested (10 questions)
+      url: `/questions/search?page=${this.state.page}`,
       type: "POST",
       dataType: 'json',
       contentType: 'application/json',
-      data: JSON.stringify({searchTerm: searchTerm}),
+      data: JSON.stringify({searchTerm: this.state.searchTerm}),
       xhrFields: {
         withCredentials: true
       },
@@ -81,12 +81,31 @@ class QuizView extends Component {
     event.preventDefault();
     const formatGuess = this.state.guess.replace(/[.,\/#!$%\^&\*;:{}=\-_`~()]/g,"").toLowerCase()
     let evaluate =  this.evaluateAnswer()
+    this.reportAnswer(evaluate)
     this.setState({
       numCorrect: !evaluate ? this.state.numCorrect : this.state.numCorrect + 1,
       showAnswer: true,
     })
   }
 
+  reportAnswer = (correct) => {
+    // Count the answer in the question stats (the quiz goes on even if the report fails)
+    $.ajax({
+      url: '/quizzes/report',
+      type: "POST",
+      dataType: 'json',
+      contentType: 'application/json',
+      data: JSON.stringify({
+        question_id: this.state.currentQuestion.id,
+        correct: Boolean(correct)
+      }),
+      xhrFields: {
+        withCredentials: true
+      },
+      crossDomain: true
+    })
+  }
+
   restartGame = () => {
     this.setState({
       quizCategory: null,